@@ -0,0 +1,44 @@
+"""
+Compares the time each dithering engine takes to reduce an 800x480 frame to the panel palette.
+
+Run with `uv run python -m benchmarks.dithering`.
+"""
+import os
+import time
+import argparse
+import tempfile
+from PIL import Image
+from photo_processing.dithering import SupportedDitherEngines, get_dither_engine
+from photo_processing.palette_lut import PaletteLUT
+from display.framebuffer import EPD_PALETTE
+
+EXAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "example", "original", "sergio-kian-unsplash.jpg")
+
+
+def time_engine(engine, frame, lut, repeat):
+    # First call builds lazily created threshold maps, keep it out of the timing
+    engine.dither(frame, EPD_PALETTE, lut)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.dither(frame, EPD_PALETTE, lut)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=480)
+    args = parser.parse_args()
+    
+    frame = Image.open(EXAMPLE_IMAGE).convert("RGB").resize((args.width, args.height), Image.LANCZOS)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        lut = PaletteLUT(EPD_PALETTE, cache_dir=cache_dir)
+        print(f"{'engine':<16} {'ms/frame':>10}")
+        for name in SupportedDitherEngines:
+            seconds = time_engine(get_dither_engine(name.value, cache_dir=cache_dir), frame, lut, args.repeat)
+            print(f"{name.value:<16} {seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Per stage wall time and peak RSS of ImageProcessor.apply_act_palette and EPD.getbuffer.
+
+Runs offline against example/original and synthetic JPEG, PNG and HEIC images. The driver
+runs against the simulated epdconfig backend, which also reports the SPI traffic of EPD.display.
+Run with `uv run python -m benchmarks.pipeline --output results.json`.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+import PIL
+from PIL import Image
+from pillow_heif import register_heif_opener
+from photo_processing.ImageProcessor import ImageProcessor
+from utils.stage_timer import StageTimer
+from display.framebuffer import EPD_PALETTE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES_PATH = os.path.join(ROOT, "example", "original")
+ACT_PATH = os.path.join(ROOT, "display", "act", "6-color.act")
+# Synthetic format name -> (file extension, Pillow save format)
+FORMATS = {"jpeg": (".jpg", "JPEG"), "png": (".png", "PNG"), "heic": (".heic", "HEIF")}
+
+
+def synthetic_image(width, height, seed=0):
+    """Smooth color gradients with fine noise, so encoders and dithering have realistic work to do.
+    
+    Also used by the tests, a lossy decode shortcut would visibly damage the fine detail."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.stack([
+        127 + 127 * np.sin(x / width * 6.0 + y / height * 2.0),
+        127 + 127 * np.cos(y / height * 5.0),
+        255 * x / width,
+    ], axis=-1)
+    rgb += rng.normal(0, 12, rgb.shape)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8), "RGB")
+
+
+def make_inputs(directory, sizes, formats, examples):
+    inputs = []
+    if examples:
+        for photo in sorted(os.listdir(EXAMPLES_PATH)):
+            inputs.append((photo, os.path.join(EXAMPLES_PATH, photo)))
+    for width, height in sizes:
+        img = synthetic_image(width, height)
+        for name in formats:
+            extension, save_format = FORMATS[name]
+            path = os.path.join(directory, f"synthetic-{width}x{height}{extension}")
+            try:
+                img.save(path, save_format)
+            except Exception as e:
+                print(f"Skipping {name} {width}x{height}: {e}", file=sys.stderr)
+                continue
+            inputs.append((os.path.basename(path), path))
+    return inputs
+
+
+def summarize(timer, repeat):
+    return {name: {"seconds": result["seconds"] / repeat, "peak_rss_kb": result["peak_rss_kb"]} for name, result in timer.results.items()}
+
+
+def bench_processor(processor, path, output_path, repeat):
+    # Untimed warm up run builds lookup tables and threshold maps
+    processor.timer = None
+    if not processor.apply_act_palette(path, output_path):
+        return None
+    processor.timer = StageTimer()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        processor.apply_act_palette(path, output_path)
+    total = (time.perf_counter() - start) / repeat
+    stages = summarize(processor.timer, repeat)
+    processor.timer = None
+    return {"total_seconds": total, "stages": stages}
+
+
+def load_epd():
+    """Loads the driver on the simulated backend without BUSY waits, unless EPD_BACKEND picks another one."""
+    os.environ.setdefault("EPD_BACKEND", "simulated")
+    os.environ.setdefault("EPD_SIM_BUSY_SCALE", "0")
+    try:
+        from display.drivers.epd7in3e import EPD
+        return EPD()
+    except Exception as e:
+        print(f"Skipping EPD.getbuffer: {e}", file=sys.stderr)
+        return None
+
+
+def bench_getbuffer(epd, bmp_path, repeat):
+    image = Image.open(bmp_path)
+    image.load()
+    epd.timer = StageTimer()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        epd.getbuffer(image)
+    total = (time.perf_counter() - start) / repeat
+    stages = summarize(epd.timer, repeat)
+    epd.timer = None
+    return {"total_seconds": total, "stages": stages}
+
+
+def bench_display(epd, bmp_path):
+    """Time and SPI traffic of sending one frame with EPD.display, None without the simulated backend."""
+    from display.drivers import epdconfig
+    if not isinstance(epdconfig.implementation, epdconfig.Simulated):
+        return None
+    buf = epd.getbuffer(Image.open(bmp_path))
+    epdconfig.implementation.reset_stats()
+    start = time.perf_counter()
+    epd.display(buf)
+    return {"total_seconds": time.perf_counter() - start, **epdconfig.implementation.stats()}
+
+
+def print_table(cases):
+    stage_names = []
+    for case in cases:
+        for name in case["process"]["stages"]:
+            if name not in stage_names:
+                stage_names.append(name)
+    print(f"{'input':<36} " + " ".join(f"{name:>11}" for name in stage_names) + f" {'total ms':>9} {'peak MB':>8} {'getbuffer ms':>12} {'display ms':>10} {'spi tx':>7}")
+    for case in cases:
+        stages = case["process"]["stages"]
+        cells = [f"{stages[name]['seconds'] * 1000:>11.1f}" if name in stages else f"{'-':>11}" for name in stage_names]
+        peak = max(stage["peak_rss_kb"] for stage in stages.values()) / 1024
+        getbuffer = f"{case['getbuffer']['total_seconds'] * 1000:>12.1f}" if case["getbuffer"] else f"{'-':>12}"
+        display = f"{case['display']['total_seconds'] * 1000:>10.1f} {case['display']['spi_transactions']:>7}" if case["display"] else f"{'-':>10} {'-':>7}"
+        print(f"{case['input']:<36} " + " ".join(cells) + f" {case['process']['total_seconds'] * 1000:>9.1f} {peak:>8.1f} {getbuffer} {display}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="write machine readable results to this JSON file")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sizes", default="1600x1200,4032x3024,8000x6000", help="comma separated synthetic image sizes, empty for none")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated synthetic image formats")
+    parser.add_argument("--no-examples", action="store_true", help="skip the photos in example/original")
+    parser.add_argument("--ratio-mode", default="crop")
+    parser.add_argument("--dither", default="floyd_steinberg")
+    args = parser.parse_args()
+    
+    register_heif_opener()
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",") if size]
+    formats = [name for name in args.formats.split(",") if name]
+    
+    cases = []
+    with tempfile.TemporaryDirectory() as directory:
+        processor = ImageProcessor(ACT_PATH, 800, 480, rotate=False, ratio_mode=args.ratio_mode,
+                                   panel_palette=EPD_PALETTE, dither=args.dither, cache_dir=directory)
+        epd = load_epd()
+        for name, path in make_inputs(directory, sizes, formats, not args.no_examples):
+            output_path = os.path.join(directory, "out.bmp")
+            with Image.open(path) as img:
+                size = img.size
+            process = bench_processor(processor, path, output_path, args.repeat)
+            if process is None:
+                print(f"Skipping {name}: processing failed", file=sys.stderr)
+                continue
+            cases.append({
+                "input": name,
+                "format": os.path.splitext(name)[1].lstrip(".").lower(),
+                "size": list(size),
+                "bytes": os.path.getsize(path),
+                "process": process,
+                "getbuffer": bench_getbuffer(epd, output_path, args.repeat) if epd else None,
+                "display": bench_display(epd, output_path) if epd else None,
+            })
+    
+    print_table(cases)
+    if args.output:
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "pillow": PIL.__version__,
+            },
+            "settings": {"repeat": args.repeat, "ratio_mode": args.ratio_mode, "dither": args.dither, "width": 800, "height": 480},
+            "cases": cases,
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
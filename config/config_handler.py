@@ -11,6 +11,8 @@ class ConfigKeys(enum.Enum):
     DISPLAY_MANAGER = "display_manager"
     ALBUM_NAME = "album_name"
     BACKUP_ADDRESS = "backup_address"
+    EMULATOR_RECORD_PATH = "emulator_record_path"
+    EPD_BACKEND = "epd_backend"
     ALBUM_FETCH_INTERVAL = "album_fetch_interval"
     CLEAR_INTERVAL = "clear_interval"
     PHOTO_INTERVAL = "photo_interval"
@@ -18,6 +20,18 @@ class ConfigKeys(enum.Enum):
     LOG_FILE = "log_file"
     RATIO_MODE = "ratio_mode"
     ROTATE = "rotate"
+    PROCESSING_WORKERS = "processing_workers"
+    DOWNLOAD_WORKERS = "download_workers"
+    DOWNLOAD_PREVIEWS = "download_previews"
+    INCREMENTAL_SYNC = "incremental_sync"
+    SINGLE_PASS_QUANTIZE = "single_pass_quantize"
+    DITHER = "dither"
+    COLOR_METRIC = "color_metric"
+    LAZY_PROCESSING = "lazy_processing"
+    PROCESS_AHEAD = "process_ahead"
+    PROCESSED_CACHE_MB = "processed_cache_mb"
+    ORIGINALS_POLICY = "originals_policy"
+    ORIGINALS_CACHE_MB = "originals_cache_mb"
 
 def get_config(path = "config.yaml"):    
     # Load and parse the config.yaml file
@@ -33,7 +47,7 @@ def get_config(path = "config.yaml"):
     
     # Check for required keys
     required_keys = ["server_address", "x_api_key", "display_manager", "album_name"]
-    optional_keys = ["backup_address"]
+    optional_keys = ["backup_address", "emulator_record_path", "epd_backend"]
     default_keys = {"album_fetch_interval": 60, 
                     "clear_interval": 3600, 
                     "photo_interval": 30, 
@@ -41,6 +55,18 @@ def get_config(path = "config.yaml"):
                     "log_file": "/var/log/eink-daemon.log",
                     "rotate": False,
                     "ratio_mode": "crop",
+                    "processing_workers": 1,
+                    "download_workers": 4,
+                    "download_previews": False,
+                    "incremental_sync": True,
+                    "single_pass_quantize": True,
+                    "dither": "floyd_steinberg",
+                    "color_metric": "lab",
+                    "lazy_processing": False,
+                    "process_ahead": 3,
+                    "processed_cache_mb": 0,
+                    "originals_policy": "keep",
+                    "originals_cache_mb": 0,
                     }
     
     # Validate keys
@@ -56,4 +82,9 @@ def get_config(path = "config.yaml"):
         if key not in config:
             logger.warning(f"Default configuration key missing: {key}")
             config[key] = default_keys[key]
+    
+    # Lazy processing deletes processed images again, with dropped originals every one would be downloaded again
+    if config["lazy_processing"] and config["originals_policy"] == "drop":
+        logger.critical("lazy_processing cannot be combined with originals_policy \"drop\", use \"keep\" or \"master\".")
+        raise ValueError("lazy_processing cannot be combined with originals_policy \"drop\".")
     return config
@@ -0,0 +1,34 @@
+import os
+import json
+from utils.logging_setup import setup_logger
+
+
+class DisplayState:
+    """
+    Remembers the image last shown so a restart resumes the slideshow where it stopped.
+    """
+    
+    def __init__(self, path):
+        self.logger = setup_logger(__name__)
+        self.path = path
+        
+    def load(self) -> str:
+        """Returns the path of the image last shown, None if unknown."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get("image")
+        except Exception as e:
+            self.logger.error(f"Error reading display state {self.path}: {e}")
+            return None
+        
+    def save(self, image_path):
+        try:
+            # Write then rename so a crash never leaves a truncated file
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"image": image_path}, f)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Error saving display state {self.path}: {e}")
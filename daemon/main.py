@@ -8,6 +8,7 @@ from image_fetcher.immich import Immich
 from image_fetcher.image_fetcher import ImageFetcher
 from image_fetcher.search_handlers.album_search_handler import AlbumSearchHandler
 from photo_processing.ImageProcessor import ImageProcessor
+from daemon.display_state import DisplayState
 import signal
 
 
@@ -24,16 +25,22 @@ class ImmichDisplayDaemon:
             self.config = get_config()
             
             # Set up Display
-            self.display_manager = get_display_manager(self.config[ConfigKeys.DISPLAY_MANAGER.value])
+            self.display_manager = get_display_manager(
+                self.config[ConfigKeys.DISPLAY_MANAGER.value],
+                record_path=self.config[ConfigKeys.EMULATOR_RECORD_PATH.value],
+                epd_backend=self.config[ConfigKeys.EPD_BACKEND.value],
+            )
             
             # Set Up Server Handling
             self.server = Immich(
                 x_api_key=self.config[ConfigKeys.X_API_KEY.value],
                 url=self.config[ConfigKeys.SERVER_ADDRESS.value],
-                backup_url=self.config[ConfigKeys.BACKUP_ADDRESS.value]
+                backup_url=self.config[ConfigKeys.BACKUP_ADDRESS.value],
+                download_workers=self.config[ConfigKeys.DOWNLOAD_WORKERS.value],
             )
             self.search_handler = AlbumSearchHandler(
                 album_name=self.config[ConfigKeys.ALBUM_NAME.value],
+                incremental=self.config[ConfigKeys.INCREMENTAL_SYNC.value],
             )
             self.image_fetcher = ImageFetcher(
                 search_handler=self.search_handler,
@@ -43,16 +50,32 @@ class ImmichDisplayDaemon:
                     height=self.display_manager.get_height(),
                     rotate=self.config[ConfigKeys.ROTATE.value],
                     ratio_mode=self.config[ConfigKeys.RATIO_MODE.value],
+                    panel_palette=self.display_manager.get_panel_palette(),
+                    single_pass=self.config[ConfigKeys.SINGLE_PASS_QUANTIZE.value],
+                    dither=self.config[ConfigKeys.DITHER.value],
+                    color_metric=self.config[ConfigKeys.COLOR_METRIC.value],
+                    cache_dir=self.config[ConfigKeys.PHOTO_STORAGE.value],
                 ),
                 data_path=self.config[ConfigKeys.PHOTO_STORAGE.value],
-                server=self.server
+                server=self.server,
+                workers=self.config[ConfigKeys.PROCESSING_WORKERS.value],
+                use_previews=self.config[ConfigKeys.DOWNLOAD_PREVIEWS.value],
+                lazy=self.config[ConfigKeys.LAZY_PROCESSING.value],
+                processed_budget=self.config[ConfigKeys.PROCESSED_CACHE_MB.value] * 1024 * 1024,
+                originals_policy=self.config[ConfigKeys.ORIGINALS_POLICY.value],
+                originals_budget=self.config[ConfigKeys.ORIGINALS_CACHE_MB.value] * 1024 * 1024,
             )
             
-            # Initialize threading
-            self.images = []
+            # Initialize threading, self.images is an immutable snapshot replaced as a whole by the sync
+            # and data_lock is only held to swap or read it, never across display I/O
             self.data_lock = asyncio.Lock()
             
-            self._display_index = 0
+            # Start from what is already processed locally, the first sync runs in the background
+            self.display_state = DisplayState(os.path.join(self.config[ConfigKeys.PHOTO_STORAGE.value], "display_state.json"))
+            self.images = tuple(self.image_fetcher.processed_images())
+            self._display_index = self.resume_index()
+            self.logger.info(f"Loaded {len(self.images)} local images, resuming at {self._display_index}")
+            self._prefetch_task = None
             self._clear_time = 0
             self._display_time = 0
             
@@ -62,6 +85,13 @@ class ImmichDisplayDaemon:
             self.logger.error(f"Error initializing ImmichDisplayDaemon: {e}")
             raise
         
+    def resume_index(self):
+        """Index of the image after the one shown before the last shutdown, 0 if it is gone."""
+        last_image = self.display_state.load()
+        if last_image in self.images:
+            return (self.images.index(last_image) + 1) % len(self.images)
+        return 0
+        
     async def stop_threads(self):
             self.running = False
             self.logger.info("Setting stop flag")
@@ -75,10 +105,13 @@ class ImmichDisplayDaemon:
         signal.signal(signal.SIGTERM, lambda s, f: asyncio.run_coroutine_threadsafe(self.stop_threads(), loop))
         
         
-        await asyncio.gather(
-            self.download_and_process(),
-            self.display_loop(),
-        )
+        try:
+            await asyncio.gather(
+                self.download_and_process(),
+                self.display_loop(),
+            )
+        finally:
+            await asyncio.to_thread(self.image_fetcher.close)
 
         
     async def display_loop(self):
@@ -96,33 +129,94 @@ class ImmichDisplayDaemon:
             
             if next_image:
                 async with self.data_lock:
-                    if len(self.images) == 0:
-                        self.logger.warning("No images to display.")
-                    else:
-                        if self._display_index >= len(self.images):
-                            self._display_index = 0
-                        try:
-                            await asyncio.to_thread(self.display_manager.display, self.images[self._display_index])
-                            self._display_index += 1
-                            self._display_time = time.time()
-                        except Exception as e:
-                            self.logger.error(f"Error displaying image: {e}")
+                    images = self.images
+                index = await self.pick_image(images)
+                if index is None:
+                    self.logger.warning("No images to display.")
+                else:
+                    self._display_index = index
+                    current_path = images[index]
+                    # Process and load the following images while this one refreshes
+                    upcoming = [images[(index + i) % len(images)] for i in range(self.config[ConfigKeys.PROCESS_AHEAD.value] + 1)]
+                    try:
+                        await self.finish_prefetch()
+                        self._prefetch_task = asyncio.create_task(self.prefetch(upcoming))
+                        await asyncio.to_thread(self.display_manager.display, current_path)
+                        self._display_index = await self.index_after(current_path, self._display_index)
+                        self._display_time = time.time()
+                        self.display_state.save(current_path)
+                    except Exception as e:
+                        self.logger.error(f"Error displaying image: {e}")
+            waiting = len(self.images) == 0
             for a in range(self.config[ConfigKeys.PHOTO_INTERVAL.value]):
                 if not self.running:
+                    await self.finish_prefetch()
                     self.display_manager.sleep()
                     break
+                if waiting and len(self.images) > 0:
+                    # Show the first image as soon as the sync publishes one
+                    break
                 await asyncio.sleep(1)
+        await self.finish_prefetch()
         
+    async def pick_image(self, images):
+        """Index of the next image of the snapshot that is processed, skipping any that failed. None if there is none."""
+        for offset in range(len(images)):
+            index = (self._display_index + offset) % len(images)
+            try:
+                ready = await asyncio.to_thread(self.image_fetcher.ensure_processed, [images[index]], False)
+            except Exception as e:
+                self.logger.error(f"Error processing image {images[index]}: {e}")
+                ready = ()
+            if images[index] in ready:
+                return index
+            self.logger.warning(f"Skipping {images[index]}, it could not be processed.")
+        return None
+        
+    async def index_after(self, image_path, index):
+        """Index following image_path in the latest snapshot, which the sync may have swapped during the refresh."""
+        async with self.data_lock:
+            images = self.images
+        if index < len(images) and images[index] == image_path:
+            return index + 1
+        if image_path in images:
+            return images.index(image_path) + 1
+        return index
+        
+    async def finish_prefetch(self):
+        """Waits for the previous prefetch, so it never overlaps the next one or the display going to sleep."""
+        # Not cancelled, that would not stop the thread it runs in
+        task, self._prefetch_task = self._prefetch_task, None
+        if task is not None:
+            await task
+        
+    async def prefetch(self, upcoming):
+        # upcoming starts with the image being displayed so it is never evicted
+        try:
+            await asyncio.to_thread(self.image_fetcher.ensure_processed, upcoming)
+            if len(upcoming) > 1:
+                await asyncio.to_thread(self.display_manager.prepare, upcoming[1])
+        except Exception as e:
+            self.logger.error(f"Error preparing upcoming images: {e}")
         
     async def download_and_process(self):
         while self.running:
+            # Publish the image list after every processed asset instead of at the end of the cycle
+            sync = self.image_fetcher.download_and_process_iter()
             try:
-                tempImages = await asyncio.to_thread(self.image_fetcher.download_and_process)
-                async with self.data_lock:
-                    self.images = tempImages
+                while self.running:
+                    tempImages = await asyncio.to_thread(next, sync, None)
+                    if tempImages is None:
+                        break
+                    snapshot = tuple(tempImages)
+                    async with self.data_lock:
+                        self.images = snapshot
             except Exception as e:
                 self.logger.error(f"Error downloading and processing images: {e}")
                 raise
+            finally:
+                # Closing shuts down the download pool and waits for its jobs, keep it off the event loop
+                await asyncio.to_thread(sync.close)
             for a in range(self.config[ConfigKeys.ALBUM_FETCH_INTERVAL.value]):
                 if not self.running:
                     break
@@ -24,10 +24,20 @@ class BaseDisplayManager(ABC):
     def display(self, image):
         pass
     
+    def prepare(self, image):
+        """Loads image into a ready to send frame ahead of display(image). Safe to call while another image is displaying."""
+        pass
+    
     @abstractmethod
     def sleep(self):
         pass
     
     @abstractmethod
     def get_act_path(self) -> str:
-        return
\ No newline at end of file
+        return
+    
+    def get_panel_palette(self):
+        """RGB triplets in panel index order for displays that accept a packed framebuffer, otherwise None.
+        
+        Processed images are dithered against this table so their palette indices can be sent to the panel unchanged."""
+        return None
\ No newline at end of file
@@ -30,6 +30,8 @@
 
 import logging
 import display.drivers.epdconfig as epdconfig
+from display.framebuffer import EPD_PALETTE, pack_4bpp
+from utils.stage_timer import timed
 
 from PIL import Image
 
@@ -37,6 +39,26 @@ from PIL import Image
 EPD_WIDTH       = 800
 EPD_HEIGHT      = 480
 
+# Longest a refresh is expected to keep the panel busy, in seconds
+BUSY_TIMEOUT    = 60
+
+# Register setup sent by init after the hardware reset, as (command, data) pairs
+INIT_SEQUENCE   = (
+    (0xAA, b"\x49\x55\x20\x08\x09\x18"), # CMDH
+    (0x01, b"\x3F"),                         # PWR
+    (0x00, b"\x5F\x69"),                     # PSR
+    (0x03, b"\x00\x54\x00\x44"),             # POFS
+    (0x05, b"\x40\x1F\x1F\x2C"),             # BTST1
+    (0x06, b"\x6F\x1F\x17\x49"),             # BTST2
+    (0x08, b"\x6F\x1F\x1F\x22"),             # BTST3
+    (0x30, b"\x03"),                         # PLL
+    (0x50, b"\x3F"),                         # CDI
+    (0x60, b"\x02\x00"),                     # TCON
+    (0x61, b"\x03\x20\x01\xE0"),             # TRES, 800 x 480
+    (0x84, b"\x01"),                         # T_VDCS
+    (0xE3, b"\x2F"),                         # PWS
+)
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -54,6 +76,10 @@ class EPD:
         # self.ORANGE = 0x0080ff   #   0100
         self.BLUE   = 0xff0000   #   0101
         self.GREEN  = 0x00ff00   #   0110
+        # Optional utils.stage_timer.StageTimer collecting getbuffer timings
+        self.timer = None
+        # Clear buffers by color, they never change
+        self.clear_buffers = {}
         
 
     # Hardware reset
@@ -77,29 +103,40 @@ class EPD:
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
         
-    # send a lot of data   
+    # send a lot of data, any bytes like object (bytes, bytearray, memoryview, mmap) is written as is
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
         
-    def ReadBusyH(self):
+    # send a command followed by all of its data in a single write
+    def send_command_data(self, command, data):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+        
+    def send_sequence(self, sequence):
+        for command, data in sequence:
+            self.send_command_data(command, data)
+        
+    def ReadBusyH(self, timeout=BUSY_TIMEOUT):
         logger.debug("e-Paper busy H")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: busy, 1: idle
-            epdconfig.delay_ms(5)
+        if not epdconfig.wait_for_idle(timeout):      # 0: busy, 1: idle
+            raise TimeoutError(f"e-Paper still busy after {timeout} s, check the panel connection")
         logger.debug("e-Paper busy H release")
 
     def TurnOnDisplay(self):
         self.send_command(0x04) # POWER_ON
         self.ReadBusyH()
 
-        self.send_command(0x12) # DISPLAY_REFRESH
-        self.send_data(0X00)
+        self.send_command_data(0x12, b"\x00") # DISPLAY_REFRESH
         self.ReadBusyH()
         
-        self.send_command(0x02) # POWER_OFF
-        self.send_data(0X00)
+        self.send_command_data(0x02, b"\x00") # POWER_OFF
         self.ReadBusyH()
         
     def init(self):
@@ -110,66 +147,7 @@ class EPD:
         self.ReadBusyH()
         epdconfig.delay_ms(30)
 
-        self.send_command(0xAA)   
-        self.send_data(0x49)
-        self.send_data(0x55)
-        self.send_data(0x20)
-        self.send_data(0x08)
-        self.send_data(0x09)
-        self.send_data(0x18)
-
-        self.send_command(0x01)
-        self.send_data(0x3F)
-
-        self.send_command(0x00)  
-        self.send_data(0x5F)
-        self.send_data(0x69)
-
-        self.send_command(0x03)
-        self.send_data(0x00)
-        self.send_data(0x54)
-        self.send_data(0x00)
-        self.send_data(0x44) 
-
-        self.send_command(0x05)
-        self.send_data(0x40)
-        self.send_data(0x1F)
-        self.send_data(0x1F)
-        self.send_data(0x2C)
-
-        self.send_command(0x06)
-        self.send_data(0x6F)
-        self.send_data(0x1F)
-        self.send_data(0x17)
-        self.send_data(0x49)
-
-        self.send_command(0x08)
-        self.send_data(0x6F)
-        self.send_data(0x1F)
-        self.send_data(0x1F)
-        self.send_data(0x22)
-
-        self.send_command(0x30)
-        self.send_data(0x03)
-
-        self.send_command(0x50)
-        self.send_data(0x3F)
-
-        self.send_command(0x60)
-        self.send_data(0x02)
-        self.send_data(0x00)
-
-        self.send_command(0x61)
-        self.send_data(0x03)
-        self.send_data(0x20)
-        self.send_data(0x01) 
-        self.send_data(0xE0)
-
-        self.send_command(0x84)
-        self.send_data(0x01)
-
-        self.send_command(0xE3)
-        self.send_data(0x2F)
+        self.send_sequence(INIT_SEQUENCE)
 
         self.send_command(0x04)
         self.ReadBusyH()
@@ -178,7 +156,7 @@ class EPD:
     def getbuffer(self, image):
         # Create a pallette with the 7 colors supported by the panel
         pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,  255,0,0,  0,0,0,  0,0,255,  0,255,0) + (0,0,0)*249)
+        pal_image.putpalette(tuple(value for rgb in EPD_PALETTE for value in rgb) + (0,0,0)*249)
         # pal_image.putpalette( (0,0,0,  255,255,255,  0,255,0,   0,0,255,  255,0,0,  255,255,0, 255,128,0) + (0,0,0)*249)
 
         # Check if we need to rotate the image
@@ -191,34 +169,30 @@ class EPD:
             logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
 
         # Convert the soruce image to the 7 colors, dithering if needed
-        image_7color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_7color = bytearray(image_7color.tobytes('raw'))
+        with timed(self.timer, "convert"):
+            image_rgb = image_temp.convert("RGB")
+        with timed(self.timer, "quantize"):
+            image_7color = image_rgb.quantize(palette=pal_image)
 
         # PIL does not support 4 bit color, so pack the 4 bits of color
         # into a single byte to transfer to the panel
-        buf = [0x00] * int(self.width * self.height / 2)
-        idx = 0
-        for i in range(0, len(buf_7color), 2):
-            buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
-            idx += 1
-            
-        return buf
+        with timed(self.timer, "pack"):
+            return pack_4bpp(image_7color.tobytes('raw'))
 
     def display(self, image):
-        self.send_command(0x10)
-        self.send_data2(image)
+        self.send_command_data(0x10, image)
 
         self.TurnOnDisplay()
         
     def Clear(self, color=0x11):
-        self.send_command(0x10)
-        self.send_data2([color] * int(self.height) * int(self.width/2))
+        if color not in self.clear_buffers:
+            self.clear_buffers[color] = bytes([color]) * (self.height * self.width // 2)
+        self.send_command_data(0x10, self.clear_buffers[color])
 
         self.TurnOnDisplay()
 
     def sleep(self):
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.send_command_data(0x07, b"\xA5") # DEEP_SLEEP
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
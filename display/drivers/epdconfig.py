@@ -38,6 +38,20 @@ from ctypes import CDLL
 logger = logging.getLogger(__name__)
 
 
+def wait_for_rising_edge(GPIO, pin, timeout):
+    """Blocks until pin reads high or timeout seconds pass, sleeping in wait_for_edge between checks.
+
+    The level is checked again every second, so an edge landing between the check and the wait
+    costs at most one second."""
+    deadline = time.monotonic() + timeout
+    while GPIO.input(pin) == 0:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        GPIO.wait_for_edge(pin, GPIO.RISING, timeout=max(1, int(min(remaining, 1.0) * 1000)))
+    return True
+
+
 class RaspberryPi:
     # Pin definition
     RST_PIN  = 17
@@ -98,6 +112,10 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_for_idle(self, timeout):
+        # BUSY is high when idle, gpiozero wakes up on the edge instead of polling
+        return self.GPIO_BUSY_PIN.wait_for_active(timeout)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -201,6 +219,9 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_for_idle(self, timeout):
+        return wait_for_rising_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
@@ -259,6 +280,9 @@ class SunriseX3:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_for_idle(self, timeout):
+        return wait_for_rising_edge(self.GPIO, self.BUSY_PIN, timeout)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -301,20 +325,139 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
-
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
+class Simulated:
+    """
+    Software stand-in for the panel, selected with EPD_BACKEND=simulated.
+
+    Records every SPI write and GPIO toggle and holds BUSY low after the commands that keep
+    the panel busy, for the durations in busy_seconds scaled by EPD_SIM_BUSY_SCALE (0 for no
+    waiting). stats() reports the bytes sent, SPI transactions and time spent waiting on BUSY,
+    busy_reads counts polls of the BUSY pin that an event driven wait should not need.
+    """
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    # Seconds BUSY stays low after each command, a full refresh of the 7.3" panel takes about 12 s
+    BUSY_SECONDS = {
+        0x04: 0.1,   # POWER_ON
+        0x12: 12.0,  # DISPLAY_REFRESH
+        0x02: 0.1,   # POWER_OFF
+    }
+    # Calls kept in trace, older ones are dropped
+    TRACE_LIMIT = 100000
+
+    def __init__(self):
+        from collections import deque
+        scale = float(os.environ.get("EPD_SIM_BUSY_SCALE", "1"))
+        self.busy_seconds = {command: seconds * scale for command, seconds in self.BUSY_SECONDS.items()}
+        self.pins = {self.RST_PIN: 0, self.DC_PIN: 0, self.CS_PIN: 1, self.PWR_PIN: 0}
+        self.trace = deque(maxlen=self.TRACE_LIMIT)
+        self.busy_until = 0.0
+        self.busy_since = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.trace.clear()
+        self.spi_bytes = 0
+        self.spi_transactions = 0
+        self.commands = 0
+        self.gpio_writes = 0
+        self.busy_reads = 0
+        self.busy_wait_seconds = 0.0
+
+    def stats(self):
+        return {
+            "spi_bytes": self.spi_bytes,
+            "spi_transactions": self.spi_transactions,
+            "commands": self.commands,
+            "gpio_writes": self.gpio_writes,
+            "busy_reads": self.busy_reads,
+            "busy_wait_seconds": self.busy_wait_seconds,
+        }
+
+    def set_busy(self, seconds):
+        self.busy_until = max(self.busy_until, time.monotonic() + seconds)
+
+    def digital_write(self, pin, value):
+        self.gpio_writes += 1
+        self.trace.append(("gpio", pin, value))
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin != self.BUSY_PIN:
+            return self.pins.get(pin, 0)
+        self.busy_reads += 1
+        now = time.monotonic()
+        if now < self.busy_until:
+            if self.busy_since is None:
+                self.busy_since = now
+            return 0
+        if self.busy_since is not None:
+            self.busy_wait_seconds += now - self.busy_since
+            self.busy_since = None
+        return 1
+
+    def delay_ms(self, delaytime):
+        time.sleep(delaytime / 1000.0)
+
+    def wait_for_idle(self, timeout):
+        wait = min(self.busy_until - time.monotonic(), timeout)
+        if wait > 0:
+            time.sleep(wait)
+            self.busy_wait_seconds += wait
+        return time.monotonic() >= self.busy_until
+
+    def spi_writebyte(self, data):
+        self.write(data)
+        if self.pins[self.DC_PIN] == 0:
+            self.commands += 1
+            self.set_busy(self.busy_seconds.get(data[0], 0))
+
+    def spi_writebyte2(self, data):
+        self.write(data)
+
+    def write(self, data):
+        self.spi_transactions += 1
+        self.spi_bytes += len(data)
+        # Only commands are kept whole, data is recorded by length
+        self.trace.append(("spi", self.pins[self.DC_PIN], data[0] if self.pins[self.DC_PIN] == 0 else len(data)))
+
+    def module_init(self, cleanup=False):
+        self.pins[self.PWR_PIN] = 1
+        return 0
+
+    def module_exit(self, cleanup=False):
+        logger.debug("close simulated 5V")
+        self.pins[self.RST_PIN] = 0
+        self.pins[self.DC_PIN] = 0
+        self.pins[self.PWR_PIN] = 0
+
+
+def detect_implementation():
+    if os.environ.get("EPD_BACKEND", "").lower() == "simulated":
+        return Simulated()
+
+    if sys.version_info[0] == 2:
+        process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
+    else:
+        process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
+    output, _ = process.communicate()
+    if sys.version_info[0] == 2:
+        output = output.decode(sys.stdout.encoding)
+
+    if "Raspberry" in output:
+        return RaspberryPi()
+    elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        return SunriseX3()
+    else:
+        return JetsonNano()
+
+
+implementation = detect_implementation()
 
 for func in [x for x in dir(implementation) if not x.startswith('_')]:
     setattr(sys.modules[__name__], func, getattr(implementation, func))
@@ -0,0 +1,95 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+import cv2
+import numpy as np
+from utils.logging_setup import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class BaseEmulatorBackend(ABC):
+    """Where the emulator sends the frames of a refresh transition."""
+
+    def start(self, width, height):
+        pass
+
+    @abstractmethod
+    def show(self, frame):
+        """Receives one transition frame. frame is a reused buffer, copy it to keep it."""
+        pass
+
+    def finish(self, image):
+        """Receives the image the panel shows once a refresh completes."""
+        pass
+
+    def stop(self):
+        pass
+
+
+class WindowBackend(BaseEmulatorBackend):
+    """Shows frames in an OpenCV window, needs a GUI."""
+
+    def __init__(self, window_name="Virtual EPD 7in3e"):
+        self.window_name = window_name
+        self.thread = None
+        self.shutdown_thread = False
+        self.lock = threading.Lock()
+        self.frame = None
+
+    def start(self, width, height):
+        if self.thread is None:
+            self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+            self.shutdown_thread = False
+            self.thread = threading.Thread(target=self._display_loop, daemon=True)
+            self.thread.start()
+
+    def _display_loop(self):
+        cv2.namedWindow(self.window_name, cv2.WINDOW_KEEPRATIO)
+        logger.info("Starting display loop for Virtual EPD 7in3e")
+        while not self.shutdown_thread:
+            with self.lock:
+                cv2.imshow(self.window_name, self.frame)
+            if cv2.waitKey(50) & 0xFF == ord('q'):  # Press 'q' to quit
+                self.shutdown_thread = True
+                logger.warning("Display loop for Virtual EPD 7in3e interrupted by user shutting down virtual display.")
+        cv2.destroyAllWindows()
+        logger.info("Shut down display loop for Virtual EPD 7in3e")
+
+    def show(self, frame):
+        with self.lock:
+            np.copyto(self.frame, frame)
+
+    def stop(self):
+        self.shutdown_thread = True
+        self.thread = None
+
+
+class RecordingBackend(BaseEmulatorBackend):
+    """
+    Headless backend keeping the last final images in memory and optionally writing them to path.
+
+    With frames, every transition frame is written as well. Memory stays bounded by keep images.
+    """
+
+    def __init__(self, path=None, frames=False, keep=16):
+        self.path = path
+        self.frames = frames
+        self.images = deque(maxlen=keep)
+        self.refreshes = 0
+        self.frame_count = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def show(self, frame):
+        self.frame_count += 1
+        if self.path is not None and self.frames:
+            cv2.imwrite(os.path.join(self.path, f"frame-{self.refreshes:05d}-{self.frame_count:04d}.png"), frame)
+
+    def finish(self, image):
+        self.images.append(image.copy())
+        if self.path is not None:
+            cv2.imwrite(os.path.join(self.path, f"final-{self.refreshes:05d}.png"), image)
+        self.refreshes += 1
+        self.frame_count = 0
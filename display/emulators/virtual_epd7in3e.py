@@ -1,21 +1,22 @@
 from display.base_display_manager import BaseDisplayManager
 import cv2
 import time
-import queue
 import numpy as np
 from utils.logging_setup import setup_logger
-import threading
+from display.prepared_frames import PreparedFrames
+from display.emulators.backends import BaseEmulatorBackend, WindowBackend
 logger = setup_logger(__name__)
 
 class Virtual7in3e(BaseDisplayManager):
-    def __init__(self, width=800, height=480):
+    def __init__(self, width=800, height=480, backend: BaseEmulatorBackend = None):
         self.width = width
         self.height = height
-        self.windowName = "Virtual EPD 7in3e"
-        self.image = np.ones((height, self.width, 3), dtype=np.uint8) * 0
-        self.thread = None
-        self.shutdown_thread = False
-        self.queue = queue.Queue()
+        self.backend = backend if backend is not None else WindowBackend()
+        self.image = np.zeros((height, self.width, 3), dtype=np.uint8)
+        # Every transition frame is computed into this one buffer
+        self.frame = np.empty_like(self.image)
+        self.white = np.full_like(self.image, 255)
+        self.prepared = PreparedFrames()
         
     def get_width(self):
         return self.width
@@ -25,50 +26,50 @@ class Virtual7in3e(BaseDisplayManager):
     
     def init(self):
         logger.info("Initializing Virtual EPD 7in3e")
-        if self.thread is None:
-            self.thread = threading.Thread(target=self._display_loop, daemon=True)
-            self.shutdown_thread = False
-            self.thread.start()
-    
-    def _display_loop(self):
-        cv2.namedWindow(self.windowName, cv2.WINDOW_KEEPRATIO)
-        logger.info("Starting display loop for Virtual EPD 7in3e")
-        image = np.ones((self.height, self.width, 3), dtype=np.uint8) * 0
-        while not self.shutdown_thread:
-            if not self.queue.empty():
-                image = self.queue.get()
-            cv2.imshow(self.windowName, image)
-            if cv2.waitKey(50) & 0xFF == ord('q'):  # Press 'q' to quit
-                self.shutdown_thread = True
-                cv2.destroyAllWindows()
-                logger.warning("Display loop for Virtual EPD 7in3e interrupted by user shutting down virtual display.")
-        cv2.destroyAllWindows()
-        logger.info("Shut down display loop for Virtual EPD 7in3e")
+        self.backend.start(self.width, self.height)
     
     def clear(self):
         logger.info("Clearing Virtual EPD 7in3e display. Taking 12 seconds to simulate hardware.")
-        self.display_helper(np.ones((self.height, self.width, 3), dtype=np.uint8) * 255, 12)
+        self.display_helper(self.white, 12)
 
     
+    def prepare(self, imagePath):
+        if imagePath not in self.prepared:
+            self.prepared.put(imagePath, cv2.imread(imagePath))
+    
     def display(self, imagePath):
         logger.info(f"Displaying image {imagePath}. Taking 5 seconds to simulate hardware.")
-        self.display_helper(cv2.imread(imagePath), 5)
+        image = self.prepared.pop(imagePath)
+        if image is None:
+            image = cv2.imread(imagePath)
+        self.display_helper(image, 5)
+    
+    def transition(self, start, end, steps):
+        """Yields the frames of a linear fade from start to end, computed one at a time into self.frame."""
+        last = max(steps - 1, 1)
+        # Integer blend start + (end - start) * i // last, int16 holds it unless the fade is very long
+        dtype = np.int16 if 255 * last <= np.iinfo(np.int16).max else np.int32
+        difference = end.astype(dtype)
+        difference -= start
+        blend = np.empty_like(difference)
+        for i in range(steps):
+            np.multiply(difference, min(i, last), out=blend)
+            np.floor_divide(blend, last, out=blend)
+            blend += start
+            np.copyto(self.frame, blend, casting="unsafe")
+            yield self.frame
     
     def display_helper(self, imageArray, timeSeconds):
         stepsPerSecond = 5
-        start = self.image
-        end = imageArray
-        steps = timeSeconds * stepsPerSecond
-        transition_arrays = [((1 - t) * start + t * end) for t in np.linspace(0, 1, steps)]
-        transition_arrays = [arr.astype(np.uint8) for arr in transition_arrays]
-        for i, arr in enumerate(transition_arrays):
-            self.image = arr
-            self.queue.put(arr)
+        for frame in self.transition(self.image, imageArray, timeSeconds * stepsPerSecond):
+            self.backend.show(frame)
             time.sleep(1 / stepsPerSecond)
+        self.image = imageArray
+        self.backend.finish(self.image)
     
     def sleep(self):
-        logger.info("Virtual EPD 7in3e 'sleeping' closing thread")
-        self.shutdown_thread = True
+        logger.info("Virtual EPD 7in3e 'sleeping' stopping backend")
+        self.backend.stop()
 
     
     def get_act_path(self) -> str:
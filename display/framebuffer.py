@@ -0,0 +1,18 @@
+import os
+import numpy as np
+
+FRAMEBUFFER_EXTENSION = ".fb"
+
+# Panel color indices of the 7.3 inch e-Paper (E), index 4 (orange) is unused on this panel
+EPD_PALETTE = [(0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0), (0, 0, 0), (0, 0, 255), (0, 255, 0)]
+
+
+def framebuffer_path(image_path):
+    """Returns the path of the packed framebuffer stored alongside a processed image."""
+    return os.path.splitext(image_path)[0] + FRAMEBUFFER_EXTENSION
+
+
+def pack_4bpp(indices):
+    """Packs each pair of 8 bit palette indices into a single byte, high nibble first."""
+    buf = np.frombuffer(indices, dtype=np.uint8)
+    return bytearray(((buf[0::2] << 4) | buf[1::2]).tobytes())
@@ -1,3 +1,4 @@
+import os
 import enum
 from display.base_display_manager import BaseDisplayManager
 from utils.logging_setup import setup_logger
@@ -7,16 +8,27 @@ logger = setup_logger(__name__)
 class SupportedWrappers(enum.Enum):
     epd7in3e = "epd7in3e"
     epd7in3e_emulator = "epd7in3e_emulator"
+    epd7in3e_headless = "epd7in3e_headless"
     
 
-def get_display_manager(wrapper: str) -> BaseDisplayManager:
+def get_display_manager(wrapper: str, record_path=None, epd_backend=None) -> BaseDisplayManager:
+    """record_path is where the headless emulator writes the images it shows, None keeps them in memory only.
+    
+    epd_backend overrides the hardware backend detection of the epd drivers, e.g. "simulated" to run them without a panel."""
     logger.info(f"Initializing display manager for {wrapper}")
+    if epd_backend:
+        # epdconfig picks its backend when first imported
+        os.environ["EPD_BACKEND"] = epd_backend
     if wrapper == SupportedWrappers.epd7in3e.name:
         from display.wrappers.epd7in3e_wrapper import EPD7IN3E_MANAGER
         return EPD7IN3E_MANAGER()
     if wrapper == SupportedWrappers.epd7in3e_emulator.name:
         from display.emulators.virtual_epd7in3e import Virtual7in3e
         return Virtual7in3e()
+    if wrapper == SupportedWrappers.epd7in3e_headless.name:
+        from display.emulators.virtual_epd7in3e import Virtual7in3e
+        from display.emulators.backends import RecordingBackend
+        return Virtual7in3e(backend=RecordingBackend(path=record_path))
     else:
         logger.critical(f"Unsupported wrapper: {wrapper}")
         raise ValueError(f"Unsupported wrapper: {wrapper}")
\ No newline at end of file
@@ -0,0 +1,36 @@
+import threading
+from collections import OrderedDict
+
+
+class PreparedFrames:
+    """Thread safe store of frames loaded ahead of display, keyed by image path.
+    
+    Only the most recent limit frames are kept. Frames with a close method (memory maps) are closed when evicted."""
+    
+    def __init__(self, limit=2):
+        self.limit = limit
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        
+    def put(self, path, frame):
+        with self.lock:
+            self.frames[path] = frame
+            self.frames.move_to_end(path)
+            evicted = []
+            while len(self.frames) > self.limit:
+                evicted.append(self.frames.popitem(last=False)[1])
+        for old in evicted:
+            close_frame(old)
+            
+    def pop(self, path):
+        with self.lock:
+            return self.frames.pop(path, None)
+        
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.frames
+
+
+def close_frame(frame):
+    if hasattr(frame, "close"):
+        frame.close()
@@ -1,15 +1,19 @@
 from display.drivers import epd7in3e
+from display.framebuffer import framebuffer_path
+from display.prepared_frames import PreparedFrames, close_frame
 from ..base_display_manager import BaseDisplayManager
 from utils.logging_setup import setup_logger
 from PIL import Image
 
 import os
+import mmap
 
 class EPD7IN3E_MANAGER(BaseDisplayManager):
     def __init__(self):
         self.WIDTH = epd7in3e.EPD_WIDTH
         self.HEIGHT = epd7in3e.EPD_HEIGHT
         self.epd = epd7in3e.EPD()
+        self.prepared = PreparedFrames()
         self.logger = setup_logger(__name__)
         
         
@@ -27,13 +31,34 @@ class EPD7IN3E_MANAGER(BaseDisplayManager):
         self.logger.info("Clearing EPD7IN3E display")
         self.epd.Clear()
     
+    def load(self, imagePath):
+        fb_path = framebuffer_path(imagePath)
+        if os.path.exists(fb_path) and os.path.getsize(fb_path) == self.WIDTH * self.HEIGHT // 2:
+            # Packed framebuffer was prepared at download time, map it as is
+            with open(fb_path, "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.epd.getbuffer(Image.open(imagePath))
+    
+    def prepare(self, imagePath):
+        if imagePath not in self.prepared:
+            self.prepared.put(imagePath, self.load(imagePath))
+    
     def display(self, imagePath):
         self.logger.info(f"Displaying image {imagePath} on EPD7IN3E display")
-        self.epd.display(self.epd.getbuffer(Image.open(imagePath)))
+        buf = self.prepared.pop(imagePath)
+        if buf is None:
+            buf = self.load(imagePath)
+        try:
+            self.epd.display(buf)
+        finally:
+            close_frame(buf)
     
     def sleep(self):
         self.logger.info("Sleeping EPD7IN3E display")
         self.epd.sleep()
         
+    def get_panel_palette(self):
+        return epd7in3e.EPD_PALETTE
+        
     def get_act_path(self) -> str:
         return os.path.join(os.path.dirname(os.path.dirname(__file__)), "act", "6-color.act")
\ No newline at end of file
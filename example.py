@@ -39,6 +39,7 @@ class ImmichDisplayDaemon:
                     rotate=False,
                 ),                
                 data_path=self.config[ConfigKeys.PHOTO_STORAGE.value],   
+                workers=self.config[ConfigKeys.PROCESSING_WORKERS.value],
             )
             # Set up successful
             self.logger.info("ImmichDisplayDaemon initialized successfully.")
@@ -50,6 +51,7 @@ def main():
     logger = setup_logger(__name__)
     test = ImmichDisplayDaemon()
     images = test.image_fetcher.download_and_process()
+    test.image_fetcher.close()
     logger.info("Press 'q' to close display.")
     test.display_manager.init()
     test.display_manager.clear()
@@ -0,0 +1,71 @@
+import enum
+
+
+class AssetState(enum.Enum):
+    DOWNLOADED = "downloaded"
+    PROCESSED = "processed"
+    FAILED = "failed"
+
+
+class AssetEntry:
+    def __init__(self, original: str = None, processed: str = None, state: AssetState = AssetState.DOWNLOADED):
+        self.original = original
+        self.processed = processed
+        self.state = state
+
+
+class AssetIndex:
+    """
+    In-memory record of every asset in local storage (id -> original path, processed path, state).
+    
+    The fetcher updates it as it downloads, purges and processes so the disk only has to be scanned once.
+    """
+    
+    def __init__(self):
+        self.entries: dict[str, AssetEntry] = {}
+        
+    def __contains__(self, asset_id):
+        return asset_id in self.entries
+    
+    # Iteration works on copies, the sync thread may add assets while the display loop reads
+    def __iter__(self):
+        return iter(list(self.entries))
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def get(self, asset_id) -> AssetEntry:
+        return self.entries.get(asset_id)
+    
+    def add_original(self, asset_id, path):
+        entry = self.entries.setdefault(asset_id, AssetEntry())
+        entry.original = path
+        if entry.state == AssetState.FAILED:
+            entry.state = AssetState.DOWNLOADED
+        
+    def set_original(self, asset_id, path):
+        """Points a processed asset at a replacement original, None once the original is gone."""
+        self.entries[asset_id].original = path
+        
+    def set_processed(self, asset_id, path):
+        entry = self.entries.setdefault(asset_id, AssetEntry())
+        entry.processed = path
+        entry.state = AssetState.PROCESSED
+        
+    def set_failed(self, asset_id):
+        self.entries[asset_id].state = AssetState.FAILED
+        
+    def clear_processed(self, asset_id):
+        entry = self.entries[asset_id]
+        entry.processed = None
+        entry.state = AssetState.DOWNLOADED
+        
+    def remove(self, asset_id) -> AssetEntry:
+        return self.entries.pop(asset_id, None)
+    
+    def pending(self) -> list[str]:
+        """Ids of downloaded assets that still need processing."""
+        return [asset_id for asset_id, entry in list(self.entries.items()) if entry.state == AssetState.DOWNLOADED and entry.original is not None]
+    
+    def processed_paths(self) -> list[str]:
+        return [entry.processed for entry in list(self.entries.values()) if entry.state == AssetState.PROCESSED]
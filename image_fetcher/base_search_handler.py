@@ -5,6 +5,11 @@ class BaseSearchHandler(ABC):
     
     @abstractmethod
     def search(self, server: Immich) -> dict:
+        """Returns asset id -> file extension of every matching asset, None if the server could not be searched."""
         pass
+    
+    def has_changed(self, server: Immich) -> bool:
+        """Returns False only if the results of the last search are known to still be current."""
+        return True
             
         
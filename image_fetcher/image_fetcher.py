@@ -1,91 +1,471 @@
 import os
-from image_fetcher.immich import Immich
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from image_fetcher.immich import Immich, PARTIAL_SUFFIX
 from utils.logging_setup import setup_logger
 from pillow_heif import register_heif_opener
 from photo_processing.ImageProcessor import ImageProcessor
 from image_fetcher.base_search_handler import BaseSearchHandler
+from image_fetcher.asset_index import AssetIndex, AssetState
+from image_fetcher.lru_budget import LRUBudget
+from image_fetcher.storage_manager import StorageManager
+from image_fetcher.manifest import ProcessingManifest
+from display.framebuffer import framebuffer_path
 
 class ImageFetcher:
-    def __init__(self, search_handler: BaseSearchHandler, processor: ImageProcessor, data_path, server: Immich):
+    # Immich encodes preview renditions as JPEG
+    PREVIEW_EXTENSION = ".jpg"
+    
+    def __init__(self, search_handler: BaseSearchHandler, processor: ImageProcessor, data_path, server: Immich, workers: int = 1, use_previews: bool = False,
+                 lazy: bool = False, processed_budget: int = 0, originals_policy: str = "keep", originals_budget: int = 0):
         self.logger = setup_logger(__name__)
         self.server = server
         self.search_handler = search_handler
         self.processor = processor
-        self.asset_ids_and_extensions: dict[str, str] = {}
+        self.workers = workers
+        self.use_previews = use_previews
+        # Lazy mode only processes images shortly before they are displayed, see ensure_processed
+        self.lazy = lazy
+        self.cache = LRUBudget(processed_budget)
+        self.storage = StorageManager(processor, originals_policy, originals_budget)
+        # Held for every change to index, cache, storage and manifest, the sync thread and
+        # ensure_processed from the display loop both update them. Reentrant as ensure_processed
+        # holds it across process_iter.
+        self.lock = threading.RLock()
+        # Process pool shared by the sync and the display loop, created on first use and kept until close
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        # True once a sync cycle downloaded every asset of the last search
+        self.in_sync = False
+        # False if a download of the current cycle failed
+        self.download_complete = True
+        self.index = AssetIndex()
         
         self.originals_path = os.path.join(data_path, "original")
         self.processed_path = os.path.join(data_path, "processed")
         
         register_heif_opener()
+        os.makedirs(data_path, exist_ok=True)
+        self.manifest = ProcessingManifest(os.path.join(data_path, "manifest.json"))
 
         os.makedirs(self.originals_path, exist_ok=True)
         os.makedirs(self.processed_path, exist_ok=True)
         self.load_local()
         
     def load_local(self):
-        self.logger.info("Loading local assets")
-        for photo in os.listdir(self.originals_path):
-            file_name, file_extension = os.path.splitext(photo)
-            if file_name not in self.asset_ids_and_extensions:
-                self.asset_ids_and_extensions[file_name] = file_extension
+        """Rebuilds the asset index from the originals and processed folders."""
+        with self.lock:
+            self.logger.info("Loading local assets")
+            self.index = AssetIndex()
+            self.cache = LRUBudget(self.cache.budget_bytes)
+            self.storage.reset()
+            for photo in os.listdir(self.originals_path):
+                if photo.endswith(PARTIAL_SUFFIX):
+                    # Left over from an interrupted download
+                    self.remove_file(os.path.join(self.originals_path, photo))
+                    continue
+                file_name, file_extension = os.path.splitext(photo)
+                self.index.add_original(file_name, os.path.join(self.originals_path, photo))
+                self.storage.add(file_name, os.path.join(self.originals_path, photo))
                 self.logger.info(f"Loaded {photo} from originals")
+            params_hash = self.processor.params_hash()
+            # Oldest first so the least recently written images are evicted first
+            for photo in sorted(os.listdir(self.processed_path), key=lambda photo: os.path.getmtime(os.path.join(self.processed_path, photo))):
+                file_name, file_extension = os.path.splitext(photo)
+                if file_extension == ".tmp":
+                    # Left over from an interrupted save
+                    self.remove_file(os.path.join(self.processed_path, photo))
+                if file_extension != ".bmp":
+                    continue
+                entry = self.index.get(file_name)
+                path = os.path.join(self.processed_path, photo)
+                if self.manifest.is_current(file_name, entry.original if entry else None, path, params_hash):
+                    self.index.set_processed(file_name, path)
+                    self.cache.add(file_name, self.processed_size(path))
+                else:
+                    # Stale or partial output, reprocessed from the original when there is one
+                    self.logger.info(f"Processed {photo} is out of date")
+                    if entry is None:
+                        # The original was dropped, the next sync downloads it again
+                        self.remove_file(path)
+                        self.remove_file(framebuffer_path(path))
+                        self.manifest.remove(file_name)
+            self.manifest.save()
         
     def download_and_process(self) -> list[str]:
-        self.load_local()
-        self.download()
-        self.load_local()
-        self.purge_local()
-        self.load_local()
-        self.process()
+        images = []
+        for images in self.download_and_process_iter():
+            pass
+        return images
+    
+    def download_and_process_iter(self):
+        """Syncs local storage with the server, yielding the list of displayable images every time it changes.
+        
+        The first list is yielded once stale assets are purged, then a longer one as each asset finishes
+        downloading and processing, so images can be shown long before the whole album is synced."""
+        if self.in_sync and not self.search_handler.has_changed(self.server):
+            self.logger.info("No changes on server since last sync, skipping download and processing")
+            yield self.processed_images()
+            return
         
-        img_paths = []
-        for photo in os.listdir(self.processed_path):
-            img_paths.append(os.path.join(self.processed_path, photo))
-        return img_paths
+        # List the server once per cycle and share it between download and purge
+        server_set = self.search_handler.search(self.server)
+        if server_set is None:
+            # Unreachable server or missing album, carry on with what is stored locally
+            self.logger.warning("Search failed, working from local assets until the next sync")
+            if self.lazy:
+                yield self.displayable_images()
+                return
+            yield from self.process_and_publish(self.index.pending())
+            return
+        self.purge_local(server_set.keys())
+        
+        if self.lazy:
+            # Processing is left to ensure_processed, publish every asset once its download completes
+            yield self.displayable_images()
+            for _ in self.download_iter(server_set):
+                yield self.displayable_images()
+            self.in_sync = self.download_complete
+            return
+        
+        # Originals left unprocessed by an earlier cycle go first, then each asset as its download completes
+        ready = itertools.chain(self.index.pending(), (id for id, path in self.download_iter(server_set)))
+        yield from self.process_and_publish(ready)
+        self.in_sync = self.download_complete
+    
+    def process_and_publish(self, ids):
+        """Yields the processed images, then a longer list after each of ids is processed."""
+        images = self.processed_images()
+        yield list(images)
+        for id, output_path in self.process_iter(ids):
+            if output_path is None:
+                self.logger.error(f"Failed to process {id}")
+                continue
+            self.logger.info(f"Processed {id}")
+            images.append(output_path)
+            yield list(images)
+    
+    def processed_images(self) -> list[str]:
+        if self.lazy:
+            return self.displayable_images()
+        return self.index.processed_paths()
+    
+    def displayable_images(self) -> list[str]:
+        """Processed paths of every asset that is or can be processed, the display order in lazy mode."""
+        return [self.processed_file(id) for id in self.index if self.index.get(id).state != AssetState.FAILED]
+    
+    def processed_file(self, id) -> str:
+        return os.path.join(self.processed_path, id + ".bmp")
+    
+    def processed_size(self, path) -> int:
+        size = 0
+        for file in (path, framebuffer_path(path)):
+            if os.path.exists(file):
+                size += os.path.getsize(file)
+        return size
+    
+    def ensure_processed(self, paths, evict=True) -> set[str]:
+        """
+        Lazy mode: processes the upcoming images among paths that are not processed yet, in order.
+        
+        Marks them as recently used and, with evict, drops the least recently used processed images
+        beyond the disk budget. Outside lazy mode everything is processed up front and nothing is done.
+        Returns the paths that are processed and ready to display.
+        """
+        if not self.lazy:
+            return set(paths)
+        ids = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+        with self.lock:
+            for id in ids:
+                self.cache.touch(id)
+            pending = set(self.index.pending())
+            for id, output_path in self.process_iter([id for id in ids if id in pending]):
+                if output_path is None:
+                    self.logger.error(f"Failed to process {id}")
+                else:
+                    self.logger.info(f"Processed {id}")
+            if evict:
+                self.evict_processed(keep=set(ids))
+            return {path for path, id in zip(paths, ids) if id in self.index and self.index.get(id).state == AssetState.PROCESSED}
+                
+    def evict_processed(self, keep=()):
+        evicted = self.cache.evictable(keep)
+        for id in evicted:
+            entry = self.index.get(id)
+            self.cache.discard(id)
+            if entry is None or entry.processed is None:
+                continue
+            if entry.original is None:
+                # The processed image was the only copy, forget the asset so the next sync downloads it again
+                self.remove_asset(id)
+                self.in_sync = False
+                self.logger.debug(f"Evicted {id}, its original is downloaded again when needed")
+                continue
+            self.remove_file(entry.processed)
+            self.remove_file(framebuffer_path(entry.processed))
+            self.index.clear_processed(id)
+            self.manifest.remove(id)
+            self.logger.debug(f"Evicted processed {id}")
+        if evicted:
+            self.manifest.save()
             
     
-    def purge_local(self):
+    def purge_local(self, keys=None):
         self.logger.debug("Purging local assets")
-        keys = self.search_handler.search(self.server).keys()
-        for photo in os.listdir(self.originals_path):
-            file_name, file_extension = os.path.splitext(photo)
-            if file_name not in keys:
-                try:
-                    os.remove(os.path.join(self.originals_path, photo))
-                    self.logger.debug(f"Removed {photo} from orignals")
-                except Exception as e:
-                    self.logger.error(f"Error removing file: {e}")
-        for photo in os.listdir(self.processed_path):
-            file_name, file_extension = os.path.splitext(photo)
-            if file_name not in keys:
-                try:
-                    os.remove(os.path.join(self.processed_path, file_name + ".bmp"))
-                    self.logger.debug(f"Removed {file_name + '.bmp'} from processed")
-                except Exception as e:
-                    self.logger.error(f"Error removing file: {e}")
+        if keys is None:
+            server_set = self.search_handler.search(self.server)
+            if server_set is None:
+                self.logger.warning("Search failed, skipping purge")
+                return
+            keys = server_set.keys()
+        with self.lock:
+            for id in self.index:
+                if id not in keys:
+                    self.remove_asset(id)
+            self.manifest.save()
                     
     def purge_processed(self):
-        for photo in os.listdir(self.processed_path):
-            try:
-                os.remove(os.path.join(self.processed_path, photo))
-                self.logger.debug(f"Removed {photo} from processed")
-            except Exception as e:
-                self.logger.error(f"Error removing file: {e}")
+        with self.lock:
+            for id in self.index:
+                entry = self.index.get(id)
+                if entry.processed is not None:
+                    self.remove_file(entry.processed)
+                    self.remove_file(framebuffer_path(entry.processed))
+                    self.index.clear_processed(id)
+                    self.cache.discard(id)
+                    self.manifest.remove(id)
+            self.manifest.save()
+                
+    def remove_asset(self, id):
+        entry = self.index.remove(id)
+        self.cache.discard(id)
+        self.storage.discard(id)
+        self.manifest.remove(id)
+        if entry.original is not None:
+            self.remove_file(entry.original)
+        if entry.processed is not None:
+            self.remove_file(entry.processed)
+            self.remove_file(framebuffer_path(entry.processed))
+            
+    def remove_file(self, path):
+        if not os.path.exists(path):
+            return
+        try:
+            os.remove(path)
+            self.logger.debug(f"Removed {path}")
+        except Exception as e:
+            self.logger.error(f"Error removing file: {e}")
                     
-    def download(self):
+    def download(self, server_set=None) -> bool:
+        """Downloads assets missing locally. Returns False if any download failed."""
+        for _ in self.download_iter(server_set):
+            pass
+        return self.download_complete
+    
+    def download_iter(self, server_set=None):
+        """Downloads assets missing locally, yielding (id, path) as each one completes.
+        
+        With previews enabled, previews large enough for the display are kept and only the rest fall back to originals.
+        download_complete is False afterwards if any download failed."""
         self.logger.info("Downloading assets from server")
-        server_set = self.search_handler.search(self.server)
-        for id, extension in server_set.items():
-            if id not in self.asset_ids_and_extensions:
-                with open(os.path.join(self.originals_path, id+extension), "wb+") as f:
-                    f.write(self.server.downloadAsset(id))
-                    self.logger.info(f"Downloaded {id} to {self.originals_path}")
+        if server_set is None:
+            server_set = self.search_handler.search(self.server)
+        self.download_complete = server_set is not None
+        if server_set is None:
+            return
+        missing = [(id, os.path.join(self.originals_path, id+extension)) for id, extension in server_set.items() if self.needs_download(id)]
+        
+        if self.use_previews:
+            previews = [(id, os.path.join(self.originals_path, id + self.PREVIEW_EXTENSION)) for id, _ in missing]
+            originals = dict(missing)
+            missing = []
+            for id, path in self.server.downloadAssets(previews, preview=True):
+                if path is not None and self.covers_display(path):
+                    with self.lock:
+                        self.index.add_original(id, path)
+                        self.storage.add(id, path)
+                    self.logger.info(f"Downloaded preview of {id} to {self.originals_path}")
+                    yield id, path
+                    continue
+                if path is not None:
+                    os.remove(path)
+                    self.logger.info(f"Preview of {id} is smaller than the display, falling back to original")
+                missing.append((id, originals[id]))
+        
+        for id, path in self.server.downloadAssets(missing):
+            if path is None:
+                self.logger.error(f"Failed to download {id}")
+                self.download_complete = False
+            else:
+                with self.lock:
+                    self.index.add_original(id, path)
+                    self.storage.add(id, path)
+                self.logger.info(f"Downloaded {id} to {self.originals_path}")
+                yield id, path
+
+    def needs_download(self, id):
+        entry = self.index.get(id)
+        return entry is None or (entry.original is None and entry.processed is None)
+
+    def covers_display(self, path):
+        """True if the image at path is processed without upscaling, with the rotation and ratio mode the processor applies."""
+        try:
+            with Image.open(path) as img:
+                size = img.size
+        except Exception as e:
+            self.logger.error(f"Error reading preview {path}: {e}")
+            return False
+        return self.processor.covers_display(size)
 
     def process(self):
         self.logger.info("Processing images")
-        processed_photos = os.listdir(self.processed_path)
-        for photo in os.listdir(self.originals_path):
-            file_name, file_extension = os.path.splitext(photo)
-            if file_name + ".bmp" not in processed_photos:
-                self.processor.apply_act_palette(os.path.join(self.originals_path, photo), os.path.join(self.processed_path, file_name + ".bmp"))
-                self.logger.info(f"Processed {photo}")
\ No newline at end of file
+        for id, output_path in self.process_iter():
+            if output_path is None:
+                self.logger.error(f"Failed to process {id}")
+            else:
+                self.logger.info(f"Processed {id}")
+
+    def process_iter(self, ids=None):
+        """Processes indexed originals without a processed image, using a process pool when more than one worker is configured.
+        
+        ids defaults to every pending asset and may be a lazy iterable, processing starts as soon as each id arrives.
+        Yields (asset id, processed path or None on failure) in the order of ids."""
+        if ids is None:
+            ids = self.index.pending()
+        
+        params_hash = self.processor.params_hash()
+        try:
+            for id, dst, success in self.run_processor(self.sources(ids)):
+                # Results are recorded under the lock but yielded outside it
+                with self.lock:
+                    success = self.record_result(id, dst, success, params_hash)
+                yield id, dst if success else None
+        finally:
+            with self.lock:
+                self.evict_originals()
+                self.manifest.save()
+    
+    def sources(self, ids):
+        """(id, original, processed path) of each of ids, skipping assets purged in the meantime."""
+        for id in ids:
+            with self.lock:
+                entry = self.index.get(id)
+                original = entry.original if entry is not None else None
+            if original is not None:
+                yield id, original, self.processed_file(id)
+    
+    def record_result(self, id, dst, success, params_hash) -> bool:
+        entry = self.index.get(id)
+        if entry is None:
+            # Purged while it was processed
+            self.remove_file(dst)
+            self.remove_file(framebuffer_path(dst))
+            return False
+        if not success:
+            self.index.set_failed(id)
+            return False
+        original = entry.original
+        self.index.set_processed(id, dst)
+        self.cache.add(id, self.processed_size(dst))
+        self.manifest.record(id, original, dst, params_hash)
+        kept = self.storage.retain(id, original)
+        if kept != original:
+            self.index.set_original(id, kept)
+            if kept is not None:
+                self.manifest.record(id, kept, dst, params_hash)
+        return True
+    
+    def evict_originals(self):
+        """Removes originals of processed assets beyond the storage budget, unprocessed ones are kept."""
+        for id in self.storage.evictable(keep=set(self.index.pending())):
+            entry = self.index.get(id)
+            self.storage.discard(id)
+            if entry is None or entry.original is None:
+                continue
+            self.remove_file(entry.original)
+            self.index.set_original(id, None)
+            self.logger.debug(f"Evicted original of {id}")
+    
+    def run_processor(self, pending):
+        if self.workers == 1:
+            for id, src, dst in pending:
+                yield id, dst, self.processor.apply_act_palette(src, dst)
+            return
+        
+        # Only a few images are queued at a time, so a crashed worker loses little work
+        in_flight = 2 * (self.workers or os.cpu_count() or 1)
+        executor = self.get_executor()
+        futures = deque()
+        try:
+            for id, src, dst in pending:
+                try:
+                    future = executor.submit(self.processor.apply_act_palette, src, dst)
+                except BrokenProcessPool:
+                    yield from self.collect(futures, 0)
+                    executor = self.replace_executor(executor)
+                    future = executor.submit(self.processor.apply_act_palette, src, dst)
+                futures.append((id, src, dst, future))
+                # Hand back finished results in order without waiting for the rest of pending
+                if (yield from self.collect(futures, in_flight)):
+                    executor = self.replace_executor(executor)
+            yield from self.collect(futures, 0)
+        finally:
+            # Stopped early, the pool outlives this call so drop what has not started yet
+            for id, src, dst, future in futures:
+                future.cancel()
+    
+    def get_executor(self):
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers or None)
+            return self.executor
+    
+    def replace_executor(self, executor):
+        """Replaces a broken pool, unless the other thread using it already did."""
+        with self.executor_lock:
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = None
+        return self.get_executor()
+    
+    def close(self):
+        """Shuts down the process pool, waiting for the images it is processing."""
+        with self.executor_lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
+    def collect(self, futures, keep):
+        """
+        Yields the results at the head of futures that are done, waiting until at most keep are left.
+        
+        A worker that dies, e.g. killed for lack of memory, breaks the pool and every image still in it.
+        Those are then processed again one at a time, so only the image that crashed its worker fails.
+        Returns True if the pool broke.
+        """
+        broken = False
+        while futures and (broken or len(futures) > keep or futures[0][3].done()):
+            id, src, dst, future = futures.popleft()
+            if isinstance(future.exception(), BrokenProcessPool):
+                if not broken:
+                    self.logger.warning("A processing worker died, processing the images in flight one at a time")
+                broken = True
+                yield self.process_isolated(id, src, dst)
+            else:
+                yield self.processor_result(id, dst, future)
+        return broken
+    
+    def process_isolated(self, id, src, dst):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            return self.processor_result(id, dst, executor.submit(self.processor.apply_act_palette, src, dst))
+    
+    def processor_result(self, id, dst, future):
+        try:
+            return id, dst, future.result()
+        except Exception as e:
+            self.logger.error(f"Error processing {id} in worker: {e}")
+            return id, dst, False
@@ -1,18 +1,26 @@
+import os
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from utils import logging_setup
 
+# Suffix of an asset that is still being written, renamed away once the download completes
+PARTIAL_SUFFIX = ".part"
+
 class Immich:
     """
     This class contains methods for interacting with the Immich E-Ink Frame API.
     """
     
-    def __init__(self, x_api_key: str, url: str, backup_url: str = None):
+    def __init__(self, x_api_key: str, url: str, backup_url: str = None, download_workers: int = 4):
         """Initializes the Immich class with the API key and URL.
 
         Arguments:
             x_api_key -- api key for the Immich API
             url -- url to the Immich API
             backup_url -- backup url to the Immich API (for exmaple if you are out of network using vpn)
+            download_workers -- maximum number of concurrent asset downloads (default: {4})
         """
         self.x_api_key = x_api_key
         self.url = url + "/api"
@@ -21,6 +29,17 @@ class Immich:
             'Accept': 'application/json',
             'x-api-key': self.x_api_key
         }
+        self.download_workers = max(1, download_workers)
+        
+        # Keep-alive connections shared by every request, sized for concurrent downloads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.download_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Album ids resolved by name, so repeated lookups skip the album listing
+        self.album_ids = {}
+        
         self.logger = logging_setup.setup_logger(__name__)
         self.logger.info("Immich API initialized with URL: {}".format(self.url))
         if backup_url:
@@ -36,18 +55,9 @@ class Immich:
         Keyword Arguments:
             data -- data included with request (default: {None})
         """
-        try:
-            response = requests.request(method, self.url + endpoint, headers=self.headers, data=data)
-        except requests.exceptions.ConnectionError:
-            if not self.backup_url:
-                self.logger.error("Main URL connection error. Check network connection.")
-                return None
-            self.logger.error("Main URL connection error. Trying backup URL.")
-            try:
-                response = requests.request(method, self.backup_url + endpoint, headers=self.headers, data=data)
-            except requests.exceptions.ConnectionError:
-                self.logger.error("Backup URL connection error. Check network connection.")
-                return None
+        response = self._requestWithBackup(method, endpoint, headers=self.headers, data=data)
+        if response is None:
+            return None
             
         if response.status_code == 200:
             self.logger.info("Request successful.")
@@ -57,34 +67,123 @@ class Immich:
         self.logger.error("Request failed. {}: {}".format(response.status_code, response.text))
         return None
     
-    def downloadAsset(self, asset_id: str):
-        acceptDefault = self.headers["Accept"]
+    def _requestWithBackup(self, method: str, endpoint: str, **kwargs):
+        """Sends a request to the main URL, retrying against the backup URL on connection errors.
+        
+        Returns:
+            The response or None if neither URL could be reached
+        """
         try:
-            self.headers["Accept"] = "application/octet-stream"
-            response = requests.request("GET", self.url + "/assets/{}/original".format(asset_id), headers=self.headers)
+            return self.session.request(method, self.url + endpoint, **kwargs)
         except requests.exceptions.ConnectionError:
-            self.headers["Accept"] = acceptDefault
             if not self.backup_url:
                 self.logger.error("Main URL connection error. Check network connection.")
                 return None
+            self.logger.error("Main URL connection error. Trying backup URL.")
             try:
-                self.headers["Accept"] = "application/octet-stream"
-                response = requests.request("GET", self.backup_url + "/assets/{}/original".format(asset_id), headers=self.headers)
+                return self.session.request(method, self.backup_url + endpoint, **kwargs)
             except requests.exceptions.ConnectionError:
-                self.headers["Accept"] = acceptDefault
                 self.logger.error("Backup URL connection error. Check network connection.")
                 return None
-            
-        self.headers["Accept"] = acceptDefault
-        
+    
+    def _checkDownload(self, response):
         if response.status_code == 200:
-            self.logger.info("Asset {} downloaded succesfully.".format(asset_id))
-            return response.content
+            return True
         elif response.status_code == 401:
             self.logger.error("Status code 401. Unauthorized. Check your API key.")
         self.logger.error("Request failed. {}: {}".format(response.status_code, response.text))
-        return None
+        return False
+    
+    def downloadAsset(self, asset_id: str):
+        """Downloads the original file of an asset into memory.
+        
+        Arguments:
+            asset_id -- id of the asset to download
+            
+        Returns:
+            Asset bytes or None if the download failed
+        """
+        headers = dict(self.headers, Accept="application/octet-stream")
+        response = self._requestWithBackup("GET", "/assets/{}/original".format(asset_id), headers=headers)
+        if response is None or not self._checkDownload(response):
+            return None
+        self.logger.info("Asset {} downloaded succesfully.".format(asset_id))
+        return response.content
+    
+    def downloadAssetToFile(self, asset_id: str, path: str, chunk_size: int = 1024 * 1024, preview: bool = False):
+        """Streams the original file of an asset to disk, holding at most one chunk in memory.
+        
+        The data is written to path + PARTIAL_SUFFIX and renamed to path once complete,
+        so path only ever exists as a whole file.
+        
+        Arguments:
+            asset_id -- id of the asset to download
+            path -- destination of the downloaded file
+            
+        Keyword Arguments:
+            chunk_size -- bytes read from the connection at a time (default: {1 MiB})
+            preview -- download the server generated preview rendition instead of the original (default: {False})
+            
+        Returns:
+            path or None if the download failed
+        """
+        headers = dict(self.headers, Accept="application/octet-stream")
+        if preview:
+            endpoint = "/assets/{}/thumbnail?size=preview".format(asset_id)
+        else:
+            endpoint = "/assets/{}/original".format(asset_id)
+        response = self._requestWithBackup("GET", endpoint, headers=headers, stream=True)
+        if response is None:
+            return None
+        
+        partial_path = path + PARTIAL_SUFFIX
+        with response:
+            if not self._checkDownload(response):
+                return None
+            try:
+                with open(partial_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                os.replace(partial_path, path)
+            except Exception as e:
+                self.logger.error("Error writing asset {}: {}".format(asset_id, e))
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                return None
+        self.logger.info("Asset {} downloaded succesfully.".format(asset_id))
+        return path
+    
+    def downloadAssets(self, assets, preview: bool = False):
+        """Streams several assets to disk concurrently over the shared session.
         
+        At most download_workers downloads are in flight at once.
+        
+        Arguments:
+            assets -- iterable of (asset_id, destination path)
+            
+        Keyword Arguments:
+            preview -- download preview renditions instead of originals (default: {False})
+            
+        Yields:
+            (asset_id, path or None) in the order of assets
+        """
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            pending = deque()
+            for asset_id, path in assets:
+                pending.append((asset_id, executor.submit(self._safeDownload, asset_id, path, preview)))
+                if len(pending) >= self.download_workers:
+                    asset_id, future = pending.popleft()
+                    yield asset_id, future.result()
+            while pending:
+                asset_id, future = pending.popleft()
+                yield asset_id, future.result()
+    
+    def _safeDownload(self, asset_id: str, path: str, preview: bool):
+        try:
+            return self.downloadAssetToFile(asset_id, path, preview=preview)
+        except Exception as e:
+            self.logger.error("Error downloading asset {}: {}".format(asset_id, e))
+            return None
         
     def getAllAlbums(self):
         """Retrieves all albums from the Immich API.
@@ -95,20 +194,35 @@ class Immich:
         albums = self.makeRequest("GET", "/albums")
         return albums
     
-    def getAlbumInfo(self, album_id: str):
+    def getAlbumInfo(self, album_id: str, without_assets: bool = False):
         """Retrieves a specific album from the Immich API.
         
         Arguments:
             album_id -- id of the album to retrieve from the API
+            
+        Keyword Arguments:
+            without_assets -- only retrieve the album metadata, not its asset list (default: {False})
         """
+        if without_assets:
+            return self.makeRequest("GET", "/albums/{}?withoutAssets=true".format(album_id))
         return self.makeRequest("GET", "/albums/{}".format(album_id))
     
     def getAlbumInfoByName(self, album_name: str):
         """Retrieves a specific album from the Immich API by name.
         
+        The album id is cached, the album listing is only requested again when the cached id fails.
+        
         Arguments:
             album_name -- name of the album to retrieve from the API
         """
+        album_id = self.album_ids.get(album_name)
+        if album_id is not None:
+            album = self.getAlbumInfo(album_id)
+            if album is not None:
+                return album
+            self.logger.warning("Cached id for album '{}' failed, resolving it again.".format(album_name))
+            del self.album_ids[album_name]
+        
         albums = self.getAllAlbums()
         
         if albums is None:
@@ -116,6 +230,7 @@ class Immich:
         
         for album in albums:
             if album["albumName"] == album_name:
+                self.album_ids[album_name] = album["id"]
                 return self.getAlbumInfo(album["id"])
         return None
     
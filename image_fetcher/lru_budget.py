@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+
+class LRUBudget:
+    """
+    Least recently used record of asset files and the bytes they take on disk.
+
+    A budget of 0 never evicts anything.
+    """
+
+    def __init__(self, budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        self.sizes: OrderedDict[str, int] = OrderedDict()
+        self.total = 0
+
+    def __contains__(self, asset_id):
+        return asset_id in self.sizes
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def add(self, asset_id, size):
+        self.discard(asset_id)
+        self.sizes[asset_id] = size
+        self.total += size
+
+    def touch(self, asset_id):
+        if asset_id in self.sizes:
+            self.sizes.move_to_end(asset_id)
+
+    def discard(self, asset_id):
+        self.total -= self.sizes.pop(asset_id, 0)
+
+    def evictable(self, keep=()) -> list[str]:
+        """Ids to drop, least recently used first, to get back within the budget without touching keep."""
+        if self.budget_bytes <= 0:
+            return []
+        excess = self.total - self.budget_bytes
+        evict = []
+        for asset_id, size in self.sizes.items():
+            if excess <= 0:
+                break
+            if asset_id in keep:
+                continue
+            evict.append(asset_id)
+            excess -= size
+        return evict
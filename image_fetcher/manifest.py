@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+from utils.logging_setup import setup_logger
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ProcessingManifest:
+    """
+    JSON record of how every processed image was produced.
+    
+    Each asset id maps to the checksum, size and mtime of the original it was made from,
+    a hash of the processing parameters and the size of the processed output. A processed
+    image is only trusted while all of those still match.
+    """
+    
+    def __init__(self, path):
+        self.logger = setup_logger(__name__)
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+        self.load()
+        
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error reading manifest {self.path}, all images will be reprocessed: {e}")
+            self.entries = {}
+            
+    def save(self):
+        if not self.dirty:
+            return
+        # Write then rename so a crash never leaves a truncated manifest
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+        
+    def record(self, asset_id, original, processed, params_hash):
+        stat = os.stat(original)
+        self.entries[asset_id] = {
+            "source_sha256": file_checksum(original),
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            "params": params_hash,
+            "output_size": os.path.getsize(processed),
+        }
+        self.dirty = True
+        
+    def remove(self, asset_id):
+        if self.entries.pop(asset_id, None) is not None:
+            self.dirty = True
+            
+    def is_current(self, asset_id, original, processed, params_hash) -> bool:
+        """Returns True if processed is a complete output of original made with params_hash.
+        
+        The original is only re-hashed when its size or mtime differ from the recorded ones."""
+        entry = self.entries.get(asset_id)
+        if entry is None or entry["params"] != params_hash:
+            return False
+        if not os.path.exists(processed) or os.path.getsize(processed) != entry["output_size"]:
+            return False
+        if original is None:
+            return True
+        
+        stat = os.stat(original)
+        if stat.st_size == entry["source_size"] and stat.st_mtime_ns == entry["source_mtime_ns"]:
+            return True
+        if stat.st_size != entry["source_size"] or file_checksum(original) != entry["source_sha256"]:
+            return False
+        entry["source_mtime_ns"] = stat.st_mtime_ns
+        self.dirty = True
+        return True
@@ -3,15 +3,38 @@ import os
 from utils.logging_setup import setup_logger
 
 class AlbumSearchHandler(BaseSearchHandler):
-    def __init__(self, album_name):
+    def __init__(self, album_name, incremental=True):
         self.album_name = album_name
+        self.album_id = None
+        self.incremental = incremental
+        self.last_signature = None
         self.logger = setup_logger(__name__)
     
+    @staticmethod
+    def signature(album):
+        """Album fields that change whenever assets are added, removed or edited."""
+        return (album.get("updatedAt"), album.get("assetCount"), album.get("lastModifiedAssetTimestamp"))
+    
+    def has_changed(self, server) -> bool:
+        if not self.incremental or self.album_id is None or self.last_signature is None:
+            return True
+        album = server.getAlbumInfo(self.album_id, without_assets=True)
+        if album is None:
+            return True
+        if self.signature(album) == self.last_signature:
+            self.logger.debug(f"Album '{self.album_name}' unchanged since last search.")
+            return False
+        return True
+    
     def search(self, server) -> dict:
         album = server.getAlbumInfoByName(self.album_name)
         if album is None:
             self.logger.error(f"Album '{self.album_name}' not found.")
-            return {}
+            self.album_id = None
+            self.last_signature = None
+            return None
+        self.album_id = album["id"]
+        self.last_signature = self.signature(album)
         id_extension = {}
         for photo in album['assets']:
             file_name, file_extension = os.path.splitext(photo["originalPath"])
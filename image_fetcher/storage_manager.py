@@ -0,0 +1,61 @@
+import os
+import enum
+from utils.logging_setup import setup_logger
+from photo_processing.ImageProcessor import ImageProcessor
+from image_fetcher.lru_budget import LRUBudget
+
+
+class OriginalsPolicy(enum.Enum):
+    KEEP = "keep"
+    DROP = "drop"
+    MASTER = "master"
+
+
+class StorageManager:
+    """
+    Decides which originals stay on disk once processed and keeps the originals folder within a byte budget.
+
+    keep leaves originals untouched, drop deletes them after processing and master replaces them with a JPEG
+    just large enough to reprocess for the display. Beyond the budget, originals of processed assets are
+    evicted least recently added first. A missing original is only downloaded again when its processed
+    image has to be rebuilt, e.g. after the processing parameters changed.
+    """
+    MASTER_EXTENSION = ".jpg"
+
+    def __init__(self, processor: ImageProcessor, policy: str = "keep", budget_bytes: int = 0):
+        self.logger = setup_logger(__name__)
+        self.processor = processor
+        self.policy = OriginalsPolicy(policy)
+        self.usage = LRUBudget(budget_bytes)
+
+    def reset(self):
+        self.usage = LRUBudget(self.usage.budget_bytes)
+
+    def add(self, asset_id, path):
+        self.usage.add(asset_id, os.path.getsize(path))
+
+    def discard(self, asset_id):
+        self.usage.discard(asset_id)
+
+    def retain(self, asset_id, path) -> str:
+        """Applies the policy to the original of a freshly processed asset. Returns the path kept, None if it was removed."""
+        if self.policy == OriginalsPolicy.KEEP:
+            return path
+
+        if self.policy == OriginalsPolicy.MASTER:
+            master_path = os.path.splitext(path)[0] + self.MASTER_EXTENSION
+            if self.processor.save_master(path, master_path):
+                if master_path != path:
+                    os.remove(path)
+                self.add(asset_id, master_path)
+                return master_path
+            self.logger.warning(f"Keeping original of {asset_id}, master could not be saved")
+            return path
+
+        os.remove(path)
+        self.discard(asset_id)
+        self.logger.debug(f"Dropped original of {asset_id}")
+        return None
+
+    def evictable(self, keep=()) -> list[str]:
+        return self.usage.evictable(keep)
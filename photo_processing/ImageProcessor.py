@@ -1,16 +1,30 @@
+import os
+import json
+import math
+import hashlib
 from PIL import Image
 from utils.logging_setup import setup_logger
 from pillow_heif import register_heif_opener
+from display.framebuffer import framebuffer_path, pack_4bpp
+from photo_processing.palette_lut import PaletteLUT
+from photo_processing.dithering import get_dither_engine, palette_image
+from utils.stage_timer import timed
 
 
 
 class ImageProcessor:
-    def __init__(self, act_path, width, height, rotate, ratio_mode="crop"):
+    def __init__(self, act_path, width, height, rotate, ratio_mode="crop", panel_palette=None, single_pass=True,
+                 dither="floyd_steinberg", color_metric="lab", cache_dir=None):
         self.logger = setup_logger(__name__)
         self.width = width
         self.height = height
         self.rotate = rotate
         self.ratio_mode = ratio_mode
+        self.panel_palette = panel_palette
+        # Optional utils.stage_timer.StageTimer collecting per stage timings, used by the benchmarks
+        self.timer = None
+        # Dither straight to panel indices instead of to the ACT palette and then to the panel
+        self.single_pass = single_pass and panel_palette is not None
         register_heif_opener()
         
         if act_path is not None:
@@ -25,65 +39,201 @@ class ImageProcessor:
             self.palette = None
             self.logger.warning("No ACT color palette provided, bypassing palette.")
         
+        self.dither = dither
+        self.dither_engine = get_dither_engine(dither, cache_dir=cache_dir)
+        self.color_metric = color_metric
+        
+        # Engines other than Floyd-Steinberg find nearest colors through a precomputed lookup table
+        self.lut = None
+        if self.dither_engine.uses_lut and self.quantize_palette() is not None:
+            self.lut = PaletteLUT(self.quantize_palette(), metric=color_metric, cache_dir=cache_dir)
+        
+    def quantize_palette(self):
+        """Palette processed images are reduced to, None to keep full color."""
+        return self.panel_palette if self.single_pass else self.palette
+        
+    def parameters(self) -> dict:
+        """Every setting that affects the processed output."""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "rotate": self.rotate,
+            "ratio_mode": self.ratio_mode,
+            "palette": self.palette,
+            "panel_palette": self.panel_palette,
+            "single_pass": self.single_pass,
+            "dither": self.dither,
+            "color_metric": self.color_metric if self.lut is not None else None,
+        }
+        
+    def params_hash(self) -> str:
+        return hashlib.sha256(json.dumps(self.parameters(), sort_keys=True).encode()).hexdigest()
+
+    def should_rotate(self, size):
+        """True if an image of the given size fits the display better rotated by 90 degrees."""
+        aspect = float(size[0]) / float(size[1])
+        rotated_aspect = 1.0 / aspect
+        return self.rotate and abs(rotated_aspect - (self.width / self.height)) < abs(aspect - (self.width / self.height))
+    
+    def resize_scale(self, size, rotate):
+        """Scale factors (x, y) resizing an image of the given size for the display, above 1 means upscaling."""
+        width, height = size
+        target_width, target_height = (self.height, self.width) if rotate else (self.width, self.height)
+        if self.ratio_mode == "stretch":
+            return target_width / width, target_height / height
+        if self.ratio_mode == "maintain":
+            scale = min(target_width / width, target_height / height)
+        else:
+            scale = max(target_width / width, target_height / height)
+        return scale, scale
+    
+    def covers_display(self, size):
+        """True if an image of the given size is processed for the display without upscaling."""
+        return max(self.resize_scale(size, self.should_rotate(size))) <= 1.0
+    
+    def decode_size(self, size, rotate):
+        """Smallest (width, height) of an image of the given size that still covers the display after resizing."""
+        width, height = size
+        if self.ratio_mode == "stretch":
+            target_width, target_height = (self.height, self.width) if rotate else (self.width, self.height)
+            return min(width, target_width), min(height, target_height)
+        scale = min(self.resize_scale(size, rotate)[0], 1.0)
+        return math.ceil(width * scale), math.ceil(height * scale)
+    
+    # Decoding stops at this multiple of the size needed, leaving the final downscale to LANCZOS
+    REDUCING_GAP = 2
+    
+    def decode_reduced(self, img, rotate):
+        """Decodes img to RGB at a reduced resolution that still covers the display.
+        
+        JPEGs are scaled by the decoder itself (draft mode), other formats are box reduced
+        by an integer factor right after decoding, before the LANCZOS resize. Both stop at
+        REDUCING_GAP times the size needed, a box reduce straight to it aliases visibly."""
+        needed = self.decode_size(img.size, rotate)
+        gap_size = (needed[0] * self.REDUCING_GAP, needed[1] * self.REDUCING_GAP)
+        img.draft("RGB", gap_size)
+        img = img.convert("RGB")
+        factor = min(img.width // gap_size[0], img.height // gap_size[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        self.logger.debug(f"Decoded image at {img.size} for a minimum of {needed}")
+        return img
 
     def apply_act_palette(self, image_path, output_path):
-        """Converts a given photo at image_path to given act color pallet and saves to output_path."""
+        """Converts a given photo at image_path to given act color pallet and saves to output_path.
+        
+        Returns True if the processed image was saved, False otherwise."""
         
         self.logger.info(f"Processing image: {image_path}")
 
         try:
-            img = Image.open(image_path).convert("RGB")
-            self.logger.debug(f"Image opened successfully: {img.size}")
+            with timed(self.timer, "decode"):
+                img = Image.open(image_path)
+                self.logger.debug(f"Image opened successfully: {img.size}")
 
-            aspect = float(img.width) / float(img.height)
-            rotated_aspect = 1.0 / aspect
+                rotate = self.should_rotate(img.size)
+                img = self.decode_reduced(img, rotate)
 
-            if self.rotate and abs(rotated_aspect - (self.width / self.height)) < abs(aspect - (self.width / self.height)):
-                img = img.rotate(90, expand=True)
+            if rotate:
+                with timed(self.timer, "rotate"):
+                    img = img.rotate(90, expand=True)
                 self.logger.debug("Rotated image to better fit aspect ratio")
 
             if self.ratio_mode not in ["maintain", "stretch", "crop"]:
                 raise ValueError(f"Invalid ratio mode: {self.ratio_mode}")
 
-            # Resize logic
-            if self.ratio_mode == "maintain":
-                img.thumbnail((self.width, self.height), Image.LANCZOS)
-                new_img = Image.new("RGB", (self.width, self.height), (255, 255, 255))
-                paste_x = (self.width - img.width) // 2
-                paste_y = (self.height - img.height) // 2
-                new_img.paste(img, (paste_x, paste_y))
-                img = new_img
-                self.logger.debug("Maintained aspect ratio with padding")
-            
-            elif self.ratio_mode == "stretch":
-                img = img.resize((self.width, self.height), Image.LANCZOS)
-                self.logger.debug("Stretched image to fit dimensions")
-            
-            elif self.ratio_mode == "crop":
-                img_aspect = img.width / img.height
-                display_aspect = self.width / self.height
-
-                if img_aspect > display_aspect:
-                    new_width = int(img.height * display_aspect)
-                    img = img.crop(((img.width - new_width) // 2, 0, (img.width + new_width) // 2, img.height))
-                else:
-                    new_height = int(img.width / display_aspect)
-                    img = img.crop((0, (img.height - new_height) // 2, img.width, (img.height + new_height) // 2))
-
-                img = img.resize((self.width, self.height), Image.LANCZOS)
-                self.logger.debug("Cropped image to match aspect ratio")
-
-            if self.palette is not None:
-                palette_img = Image.new("P", (1, 1))
-                palette_img.putpalette([value for rgb in self.palette for value in rgb])
-                
-                # Apply palette
-                img = img.quantize(palette=palette_img, dither=Image.FLOYDSTEINBERG)
-                self.logger.debug("Applied ACT color palette")
-
-            # Save final image
-            img.save(output_path, "BMP")
+            with timed(self.timer, "resize"):
+                img = self.resize(img)
+
+            if self.quantize_palette() is not None:
+                with timed(self.timer, "quantize"):
+                    img = self.quantize(img)
+                self.logger.debug("Applied panel color palette" if self.single_pass else "Applied ACT color palette")
+
+            # Save final image, renaming into place so a crash never leaves a truncated file
+            with timed(self.timer, "save"):
+                img.save(output_path + ".tmp", "BMP")
+                os.replace(output_path + ".tmp", output_path)
             self.logger.info(f"Saved processed image to {output_path}")
+            
+            if self.panel_palette is not None:
+                with timed(self.timer, "framebuffer"):
+                    self.write_framebuffer(img, framebuffer_path(output_path))
+            return True
 
         except Exception as e:
             self.logger.error(f"Error processing image: {e}", exc_info=True)
+            return False
+
+    def save_master(self, image_path, output_path, quality=90):
+        """Saves a JPEG copy of image_path just large enough to be processed again for the display in any orientation or ratio mode.
+        
+        Returns True if the master was saved, False otherwise."""
+        try:
+            with Image.open(image_path) as img:
+                exif = img.info.get("exif")
+                scale = min(max(self.width, self.height) / min(img.size), 1.0)
+                size = (math.ceil(img.width * scale), math.ceil(img.height * scale))
+                if scale == 1.0 and img.format == "JPEG" and image_path == output_path:
+                    # Already a small enough JPEG, re-encoding would only lose quality
+                    return True
+                img.draft("RGB", size)
+                img = img.convert("RGB")
+                if img.size != size:
+                    img = img.resize(size, Image.LANCZOS)
+                options = {"quality": quality}
+                if exif:
+                    options["exif"] = exif
+                img.save(output_path + ".tmp", "JPEG", **options)
+            os.replace(output_path + ".tmp", output_path)
+            self.logger.info(f"Saved {size} master of {image_path} to {output_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error saving master image: {e}", exc_info=True)
+            return False
+
+    def resize(self, img):
+        """Fits an RGB image to the display size according to ratio_mode."""
+        if self.ratio_mode == "maintain":
+            img.thumbnail((self.width, self.height), Image.LANCZOS)
+            new_img = Image.new("RGB", (self.width, self.height), (255, 255, 255))
+            paste_x = (self.width - img.width) // 2
+            paste_y = (self.height - img.height) // 2
+            new_img.paste(img, (paste_x, paste_y))
+            img = new_img
+            self.logger.debug("Maintained aspect ratio with padding")
+            
+        elif self.ratio_mode == "stretch":
+            img = img.resize((self.width, self.height), Image.LANCZOS)
+            self.logger.debug("Stretched image to fit dimensions")
+            
+        elif self.ratio_mode == "crop":
+            img_aspect = img.width / img.height
+            display_aspect = self.width / self.height
+
+            if img_aspect > display_aspect:
+                new_width = int(img.height * display_aspect)
+                img = img.crop(((img.width - new_width) // 2, 0, (img.width + new_width) // 2, img.height))
+            else:
+                new_height = int(img.width / display_aspect)
+                img = img.crop((0, (img.height - new_height) // 2, img.width, (img.height + new_height) // 2))
+
+            img = img.resize((self.width, self.height), Image.LANCZOS)
+            self.logger.debug("Cropped image to match aspect ratio")
+        return img
+
+    def quantize(self, img):
+        """Reduces an RGB image to a P mode image over quantize_palette."""
+        return self.dither_engine.dither(img, self.quantize_palette(), self.lut)
+
+    def write_framebuffer(self, img, output_path):
+        """Saves a processed image as panel indices packed 4 bits per pixel to output_path.
+        
+        In single pass mode img already holds panel indices, otherwise it is quantized to the panel palette first."""
+        if not self.single_pass:
+            img = img.convert("RGB").quantize(palette=palette_image(self.panel_palette))
+        
+        with open(output_path + ".tmp", "wb") as f:
+            f.write(pack_4bpp(img.tobytes("raw")))
+        os.replace(output_path + ".tmp", output_path)
+        self.logger.info(f"Saved panel framebuffer to {output_path}")
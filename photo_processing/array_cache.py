@@ -0,0 +1,29 @@
+import os
+import numpy as np
+from utils.logging_setup import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def cached_array(cache_dir, name, build, shape=None):
+    """Loads <cache_dir>/<name>.npy, or calls build() and saves its result there.
+    
+    With no cache_dir the array is always built. A cached array with the wrong shape is rebuilt."""
+    cache_path = os.path.join(cache_dir, name + ".npy") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            array = np.load(cache_path)
+            if shape is None or array.shape == shape:
+                return array
+        except Exception as e:
+            logger.warning(f"Error loading cached array {cache_path}, rebuilding: {e}")
+    
+    array = build()
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # np.save appends .npy to names without it, so the temp name keeps the suffix
+        temp_path = os.path.join(cache_dir, name + ".tmp.npy")
+        np.save(temp_path, array)
+        os.replace(temp_path, cache_path)
+        logger.info(f"Saved {cache_path}")
+    return array
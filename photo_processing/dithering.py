@@ -0,0 +1,150 @@
+import enum
+import numpy as np
+from abc import ABC, abstractmethod
+from PIL import Image
+from photo_processing.array_cache import cached_array
+from photo_processing.palette_lut import PaletteLUT
+
+
+def palette_image(palette):
+    """Builds a 256 entry palette image for quantize, padding unused entries with black."""
+    palette_img = Image.new("P", (1, 1))
+    palette_img.putpalette([value for rgb in palette for value in rgb] + [0, 0, 0] * (256 - len(palette)))
+    return palette_img
+
+
+class BaseDitherEngine(ABC):
+    # Engines that map colors through a PaletteLUT get one passed to dither
+    uses_lut = True
+    
+    @abstractmethod
+    def dither(self, img, palette, lut: PaletteLUT) -> Image.Image:
+        """Reduces an RGB image to a P mode image over palette."""
+        pass
+
+
+class FloydSteinbergDither(BaseDitherEngine):
+    """Pillow's serial error diffusion."""
+    uses_lut = False
+    
+    def dither(self, img, palette, lut):
+        return img.quantize(palette=palette_image(palette), dither=Image.FLOYDSTEINBERG)
+
+
+class NoDither(BaseDitherEngine):
+    """Nearest palette color for every pixel."""
+    
+    def dither(self, img, palette, lut):
+        return lut.apply(img)
+
+
+class ThresholdMapDither(BaseDitherEngine):
+    """
+    Ordered dithering: a tiled threshold map in [-0.5, 0.5) scaled by spread is added to every channel
+    before the nearest color lookup. Every pixel is independent, so the whole frame is a few array operations.
+    """
+    
+    def __init__(self, spread=128):
+        self.spread = spread
+        self.threshold_map = None
+    
+    @abstractmethod
+    def build_map(self) -> np.ndarray:
+        pass
+    
+    def dither(self, img, palette, lut):
+        if self.threshold_map is None:
+            self.threshold_map = self.build_map()
+        rgb = np.asarray(img.convert("RGB"), dtype=np.int16)
+        height, width = rgb.shape[:2]
+        size_y, size_x = self.threshold_map.shape
+        offsets = np.round(self.threshold_map * self.spread).astype(np.int16)
+        offsets = np.tile(offsets, (-(-height // size_y), -(-width // size_x)))[:height, :width]
+        rgb += offsets[..., None]
+        np.clip(rgb, 0, 255, out=rgb)
+        
+        out = Image.fromarray(lut.indices(rgb.astype(np.uint8)), "P")
+        out.putpalette([value for rgb in palette for value in rgb])
+        return out
+
+
+class BayerDither(ThresholdMapDither):
+    def __init__(self, size=8, spread=128):
+        super().__init__(spread)
+        self.size = size
+    
+    def build_map(self):
+        matrix = np.zeros((1, 1), dtype=np.int64)
+        while matrix.shape[0] < self.size:
+            matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+        return (matrix + 0.5) / matrix.size - 0.5
+
+
+class BlueNoiseDither(ThresholdMapDither):
+    def __init__(self, size=64, spread=128, cache_dir=None):
+        super().__init__(spread)
+        self.size = size
+        self.cache_dir = cache_dir
+    
+    def build_map(self):
+        return cached_array(self.cache_dir, f"blue-noise-{self.size}", lambda: void_and_cluster(self.size), shape=(self.size, self.size))
+
+
+def void_and_cluster(size, sigma=1.5, seed=0):
+    """Generates a size x size blue noise threshold map in [-0.5, 0.5) with Ulichney's void-and-cluster method."""
+    rng = np.random.default_rng(seed)
+    freqs = np.fft.fftfreq(size)
+    kernel = np.exp(-2 * (np.pi * sigma) ** 2 * (freqs[:, None] ** 2 + freqs[None, :] ** 2))
+    
+    def energy(pattern):
+        # Toroidal gaussian blur, so the map tiles seamlessly
+        return np.real(np.fft.ifft2(np.fft.fft2(pattern) * kernel))
+    
+    def tightest_cluster(pattern):
+        return np.argmax(np.where(pattern, energy(pattern), -np.inf))
+    
+    def largest_void(pattern):
+        return np.argmin(np.where(pattern, np.inf, energy(pattern)))
+    
+    # Initial pattern: relax random points until the tightest cluster is also the largest void
+    pattern = rng.random((size, size)) < 0.1
+    while True:
+        cluster = tightest_cluster(pattern)
+        pattern.flat[cluster] = False
+        void = largest_void(pattern)
+        pattern.flat[void] = True
+        if void == cluster:
+            break
+    
+    ranks = np.zeros(size * size, dtype=np.int64)
+    ones = int(pattern.sum())
+    removing = pattern.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = tightest_cluster(removing)
+        removing.flat[cluster] = False
+        ranks[cluster] = rank
+    adding = pattern.copy()
+    for rank in range(ones, size * size):
+        void = largest_void(adding)
+        adding.flat[void] = True
+        ranks[void] = rank
+    return ((ranks.reshape(size, size) + 0.5) / (size * size) - 0.5)
+
+
+class SupportedDitherEngines(enum.Enum):
+    floyd_steinberg = "floyd_steinberg"
+    none = "none"
+    bayer = "bayer"
+    blue_noise = "blue_noise"
+
+
+def get_dither_engine(name: str, cache_dir=None) -> BaseDitherEngine:
+    if name == SupportedDitherEngines.floyd_steinberg.name:
+        return FloydSteinbergDither()
+    if name == SupportedDitherEngines.none.name:
+        return NoDither()
+    if name == SupportedDitherEngines.bayer.name:
+        return BayerDither()
+    if name == SupportedDitherEngines.blue_noise.name:
+        return BlueNoiseDither(cache_dir=cache_dir)
+    raise ValueError(f"Invalid dither mode: {name}")
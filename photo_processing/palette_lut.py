@@ -0,0 +1,69 @@
+import hashlib
+import numpy as np
+from PIL import Image
+from photo_processing.array_cache import cached_array
+
+
+def srgb_to_lab(rgb):
+    """Converts an (..., 3) array of 8 bit sRGB values to CIE L*a*b* (D65)."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([[0.4124564, 0.2126729, 0.0193339],
+                             [0.3575761, 0.7151522, 0.1191920],
+                             [0.1804375, 0.0721750, 0.9503041]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+class PaletteLUT:
+    """
+    Lookup table from quantized RGB to the index of the nearest palette color.
+    
+    The RGB cube is split into 2**bits levels per channel and the nearest color of every cell center
+    is found once (by Lab delta E or plain RGB distance), so mapping an image is a single NumPy gather.
+    Tables are cached on disk keyed by the palette bytes, bits and metric.
+    """
+    
+    def __init__(self, palette, bits=5, metric="lab", cache_dir=None):
+        if metric not in ["lab", "rgb"]:
+            raise ValueError(f"Invalid color metric: {metric}")
+        self.palette = [tuple(rgb) for rgb in palette]
+        self.bits = bits
+        self.metric = metric
+        self.table = cached_array(cache_dir, f"lut-{self.key()}", self.build, shape=(1 << (3 * bits),))
+        
+    def key(self) -> str:
+        palette_bytes = bytes(value for rgb in self.palette for value in rgb)
+        return hashlib.sha256(palette_bytes + f"{self.bits}-{self.metric}".encode()).hexdigest()[:16]
+    
+    def build(self):
+        levels = 1 << self.bits
+        step = 256 // levels
+        centers = np.arange(levels) * step + step // 2
+        r, g, b = np.meshgrid(centers, centers, centers, indexing="ij")
+        cells = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+        palette = np.array(self.palette, dtype=np.float64)
+        
+        if self.metric == "lab":
+            cells, palette = srgb_to_lab(cells), srgb_to_lab(palette)
+        
+        table = np.empty(len(cells), dtype=np.uint8)
+        # Chunked so the distance matrix stays small on low memory boards
+        for start in range(0, len(cells), 4096):
+            chunk = cells[start:start + 4096]
+            distances = ((chunk[:, None, :] - palette[None, :, :]) ** 2).sum(axis=-1)
+            table[start:start + len(chunk)] = distances.argmin(axis=1)
+        return table
+    
+    def indices(self, rgb):
+        """Maps an (H, W, 3) uint8 array to an (H, W) array of palette indices."""
+        shift = 8 - self.bits
+        q = rgb >> shift
+        return self.table[(q[..., 0].astype(np.intp) << (2 * self.bits)) | (q[..., 1].astype(np.intp) << self.bits) | q[..., 2]]
+    
+    def apply(self, img):
+        """Maps an RGB image to a P mode image over the palette without dithering."""
+        out = Image.fromarray(self.indices(np.asarray(img.convert("RGB"))), "P")
+        out.putpalette([value for rgb in self.palette for value in rgb])
+        return out
@@ -0,0 +1,51 @@
+import re
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class AssetServer:
+    """
+    Minimal stand-in for the Immich asset endpoints on an ephemeral localhost port.
+
+    originals and previews map asset ids to the bytes served, any other id answers 404.
+    Every response waits delay seconds first, so concurrent downloads can be told apart from sequential ones.
+    """
+
+    def __init__(self, originals=None, previews=None, delay=0.0):
+        self.originals = originals or {}
+        self.previews = previews or {}
+        self.delay = delay
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                time.sleep(server.delay)
+                match = re.fullmatch(r"/api/assets/([^/]+)/(original|thumbnail\?size=preview)", self.path)
+                files = server.originals if match and match.group(2) == "original" else server.previews
+                body = files.get(match.group(1)) if match else None
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,28 @@
+import unittest
+import numpy as np
+from display.framebuffer import EPD_PALETTE, pack_4bpp
+
+
+def pack_per_pixel(indices):
+    """The per pixel loop EPD.getbuffer used before packing was vectorized."""
+    buf_7color = bytearray(indices)
+    buf = [0x00] * (len(buf_7color) // 2)
+    idx = 0
+    for i in range(0, len(buf_7color), 2):
+        buf[idx] = (buf_7color[i] << 4) + buf_7color[i+1]
+        idx += 1
+    return buf
+
+
+class PackTest(unittest.TestCase):
+    def test_matches_per_pixel_loop(self):
+        rng = np.random.default_rng(0)
+        indices = rng.integers(0, len(EPD_PALETTE), 800 * 480, dtype=np.uint8).tobytes()
+        self.assertEqual(bytes(pack_4bpp(indices)), bytes(pack_per_pixel(indices)))
+        
+    def test_high_nibble_first(self):
+        self.assertEqual(bytes(pack_4bpp(bytes([1, 6, 4, 0]))), b"\x16\x40")
+
+
+if __name__ == "__main__":
+    unittest.main()
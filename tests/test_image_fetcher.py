@@ -0,0 +1,207 @@
+import io
+import os
+import tempfile
+import unittest
+from PIL import Image
+from image_fetcher.immich import Immich
+from image_fetcher.image_fetcher import ImageFetcher
+from image_fetcher.base_search_handler import BaseSearchHandler
+from photo_processing.ImageProcessor import ImageProcessor
+from tests.asset_server import AssetServer
+
+ACT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "display", "act", "6-color.act")
+
+
+def encoded(size, image_format):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 100, 50)).save(buf, image_format)
+    return buf.getvalue()
+
+
+class StaticSearchHandler(BaseSearchHandler):
+    def __init__(self, results):
+        self.results = results
+        
+    def search(self, server):
+        return self.results
+
+
+class FailingSearchHandler(BaseSearchHandler):
+    def search(self, server):
+        return None
+
+
+class OfflineSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name, "original"))
+        with open(os.path.join(self.directory.name, "original", "a0.jpg"), "wb") as f:
+            f.write(encoded((1600, 1200), "JPEG"))
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def fetcher(self, search_handler, ratio_mode="crop"):
+        return ImageFetcher(search_handler, ImageProcessor(ACT_PATH, 800, 480, rotate=False, ratio_mode=ratio_mode),
+                            self.directory.name, server=None)
+        
+    def test_failed_search_processes_local_originals(self):
+        fetcher = self.fetcher(FailingSearchHandler())
+        images = fetcher.download_and_process()
+        self.assertEqual(images, [os.path.join(fetcher.processed_path, "a0.bmp")])
+        self.assertEqual(fetcher.index.pending(), [])
+        self.assertTrue(os.path.exists(os.path.join(fetcher.originals_path, "a0.jpg")))
+        
+    def test_failed_search_reprocesses_stale_outputs(self):
+        self.fetcher(FailingSearchHandler()).download_and_process()
+        fetcher = self.fetcher(FailingSearchHandler(), ratio_mode="maintain")
+        self.assertEqual(fetcher.index.pending(), ["a0"])
+        images = fetcher.download_and_process()
+        self.assertEqual(images, [os.path.join(fetcher.processed_path, "a0.bmp")])
+        self.assertTrue(fetcher.manifest.is_current("a0", fetcher.index.get("a0").original, images[0], fetcher.processor.params_hash()))
+
+
+class CrashingProcessor(ImageProcessor):
+    """Kills its worker process on one image, like the kernel does when a worker runs out of memory."""
+    
+    def __init__(self, crash_id, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crash_id = crash_id
+        
+    def apply_act_palette(self, src, dst):
+        if os.path.splitext(os.path.basename(src))[0] == self.crash_id:
+            os._exit(1)
+        return super().apply_act_palette(src, dst)
+
+
+class CrashedWorkerTest(unittest.TestCase):
+    IDS = [f"a{i}" for i in range(8)]
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.directory.name, "original"))
+        for id in self.IDS:
+            with open(os.path.join(self.directory.name, "original", id + ".jpg"), "wb") as f:
+                f.write(encoded((400, 300), "JPEG"))
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def test_only_the_crashing_image_fails(self):
+        fetcher = ImageFetcher(FailingSearchHandler(), CrashingProcessor("a1", ACT_PATH, 800, 480, rotate=False),
+                               self.directory.name, server=None, workers=2)
+        self.addCleanup(fetcher.close)
+        results = dict(fetcher.process_iter(iter(self.IDS)))
+        self.assertEqual(list(results), self.IDS)
+        self.assertIsNone(results["a1"])
+        self.assertEqual([id for id in self.IDS if results[id] is None], ["a1"])
+        self.assertEqual(fetcher.index.pending(), [])
+        self.assertEqual(sorted(fetcher.index.processed_paths()), sorted(results[id] for id in self.IDS if id != "a1"))
+
+
+class CopyServer:
+    """Stands in for Immich by copying files from a local folder."""
+    
+    def __init__(self, source_path):
+        self.source_path = source_path
+        self.downloaded = []
+        
+    def downloadAssets(self, assets, preview=False):
+        for id, path in assets:
+            with open(os.path.join(self.source_path, id + ".jpg"), "rb") as src, open(path, "wb") as dst:
+                dst.write(src.read())
+            self.downloaded.append(id)
+            yield id, path
+
+
+class LazyEvictionTest(unittest.TestCase):
+    IDS = [f"a{i}" for i in range(4)]
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source_path = os.path.join(self.directory.name, "source")
+        os.makedirs(self.source_path)
+        for id in self.IDS:
+            with open(os.path.join(self.source_path, id + ".jpg"), "wb") as f:
+                f.write(encoded((1600, 1200), "JPEG"))
+        self.server = CopyServer(self.source_path)
+        # Room for a single processed image and no originals of processed assets
+        self.fetcher = ImageFetcher(StaticSearchHandler({id: ".jpg" for id in self.IDS}), ImageProcessor(ACT_PATH, 800, 480, rotate=False),
+                                    os.path.join(self.directory.name, "data"), self.server, lazy=True, processed_budget=1, originals_budget=1)
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def test_processed_budget_holds_without_originals(self):
+        images = self.fetcher.download_and_process()
+        for path in images:
+            self.fetcher.ensure_processed([path])
+            self.assertEqual(os.listdir(self.fetcher.processed_path), [os.path.basename(path)])
+            self.assertLessEqual(len(os.listdir(self.fetcher.originals_path)), len(self.IDS))
+        self.assertEqual(len(self.fetcher.cache), 1)
+        
+        # Assets whose only copy was evicted are downloaded again by the next sync
+        self.assertEqual(sorted(self.fetcher.download_and_process()), sorted(images))
+        self.assertEqual(sorted(self.server.downloaded), sorted(self.IDS + self.IDS[:-1]))
+        
+    def test_ensure_processed_reports_failures(self):
+        images = self.fetcher.download_and_process()
+        with open(self.fetcher.index.get("a1").original, "wb") as f:
+            f.write(b"not an image")
+        ready = self.fetcher.ensure_processed(images[:2], evict=False)
+        self.assertEqual(ready, {images[0]})
+        
+    def test_ensure_processed_reuses_the_process_pool(self):
+        fetcher = ImageFetcher(StaticSearchHandler({id: ".jpg" for id in self.IDS}), ImageProcessor(ACT_PATH, 800, 480, rotate=False),
+                               os.path.join(self.directory.name, "data"), self.server, lazy=True, workers=2)
+        self.addCleanup(fetcher.close)
+        images = fetcher.download_and_process()
+        self.assertEqual(fetcher.ensure_processed(images[:1]), {images[0]})
+        executor = fetcher.executor
+        self.assertIsNotNone(executor)
+        self.assertEqual(fetcher.ensure_processed(images[1:2]), {images[1]})
+        self.assertIs(fetcher.executor, executor)
+        fetcher.close()
+        self.assertIsNone(fetcher.executor)
+
+
+class PreviewDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def test_previews_covering_the_display_replace_originals(self):
+        originals = {"large": encoded((3000, 2000), "PNG"), "small": encoded((3000, 2000), "PNG"), "tall": encoded((2000, 4800), "PNG")}
+        # Without rotation the tall preview is cropped to 600x360, below the display resolution
+        previews = {"large": encoded((1440, 960), "JPEG"), "small": encoded((400, 300), "JPEG"), "tall": encoded((600, 1440), "JPEG")}
+        with AssetServer(originals, previews) as server:
+            fetcher = ImageFetcher(
+                StaticSearchHandler({"large": ".png", "small": ".png", "tall": ".png"}),
+                ImageProcessor(ACT_PATH, 800, 480, rotate=False),
+                self.directory.name,
+                Immich(x_api_key="key", url=server.url),
+                use_previews=True,
+            )
+            self.assertTrue(fetcher.download())
+            requested = list(server.requests)
+        
+        # The large preview is kept as is, the small and tall ones fall back to the original
+        large = fetcher.index.get("large").original
+        small = fetcher.index.get("small").original
+        self.assertEqual(os.path.basename(large), "large" + ImageFetcher.PREVIEW_EXTENSION)
+        with open(large, "rb") as f:
+            self.assertEqual(f.read(), previews["large"])
+        self.assertEqual(os.path.basename(small), "small.png")
+        with open(small, "rb") as f:
+            self.assertEqual(f.read(), originals["small"])
+        self.assertFalse(os.path.exists(os.path.join(fetcher.originals_path, "small" + ImageFetcher.PREVIEW_EXTENSION)))
+        self.assertNotIn("/api/assets/large/original", requested)
+        self.assertIn("/api/assets/small/original", requested)
+        self.assertEqual(os.path.basename(fetcher.index.get("tall").original), "tall.png")
+        self.assertIn("/api/assets/tall/original", requested)
+
+
+if __name__ == "__main__":
+    unittest.main()
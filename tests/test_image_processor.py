@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+from photo_processing.ImageProcessor import ImageProcessor
+from benchmarks.pipeline import synthetic_image
+
+ACT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "display", "act", "6-color.act")
+
+
+def psnr(a, b):
+    mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+class ReducedDecodeTest(unittest.TestCase):
+    # Lowest PSNR in dB accepted between the reduced and the full resolution decode
+    MIN_PSNR = 40
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.sources = []
+        for width, height in ((3000, 2000), (2000, 3000)):
+            img = synthetic_image(width, height)
+            for extension, image_format in ((".jpg", "JPEG"), (".png", "PNG")):
+                path = os.path.join(cls.directory.name, f"{width}x{height}{extension}")
+                img.save(path, image_format)
+                cls.sources.append(path)
+                
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        
+    def resized(self, processor, path, rotate, reduced):
+        with Image.open(path) as img:
+            img = processor.decode_reduced(img, rotate) if reduced else img.convert("RGB")
+        if rotate:
+            img = img.rotate(90, expand=True)
+        return processor.resize(img)
+        
+    def test_reduced_decode_matches_full_decode(self):
+        for ratio_mode in ("crop", "maintain", "stretch"):
+            for rotate in (False, True):
+                processor = ImageProcessor(ACT_PATH, 800, 480, rotate=rotate, ratio_mode=ratio_mode)
+                for path in self.sources:
+                    with self.subTest(ratio_mode=ratio_mode, rotate=rotate, source=os.path.basename(path)):
+                        full = self.resized(processor, path, rotate, reduced=False)
+                        reduced = self.resized(processor, path, rotate, reduced=True)
+                        self.assertEqual(reduced.size, full.size)
+                        self.assertGreater(psnr(reduced, full), self.MIN_PSNR)
+                        
+    def test_decode_size_covers_display(self):
+        for ratio_mode in ("crop", "maintain", "stretch"):
+            processor = ImageProcessor(ACT_PATH, 800, 480, rotate=False, ratio_mode=ratio_mode)
+            for rotate in (False, True):
+                target_width, target_height = (480, 800) if rotate else (800, 480)
+                for size in ((4000, 3000), (3000, 4000), (640, 400)):
+                    width, height = processor.decode_size(size, rotate)
+                    with self.subTest(ratio_mode=ratio_mode, rotate=rotate, size=size):
+                        if ratio_mode == "crop" and (width, height) != size:
+                            self.assertGreaterEqual(width, target_width)
+                            self.assertGreaterEqual(height, target_height)
+                        self.assertLessEqual(width, size[0])
+                        self.assertLessEqual(height, size[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
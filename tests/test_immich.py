@@ -0,0 +1,52 @@
+import os
+import time
+import tempfile
+import unittest
+from image_fetcher.immich import Immich, PARTIAL_SUFFIX
+from tests.asset_server import AssetServer
+
+
+class DownloadAssetsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.originals = {f"a{i}": os.urandom(1000 + i) for i in range(8)}
+        
+    def tearDown(self):
+        self.directory.cleanup()
+        
+    def download(self, server, workers, ids):
+        immich = Immich(x_api_key="key", url=server.url, download_workers=workers)
+        assets = [(id, os.path.join(self.directory.name, f"{workers}-{id}.jpg")) for id in ids]
+        start = time.perf_counter()
+        results = list(immich.downloadAssets(assets))
+        return results, time.perf_counter() - start
+        
+    def test_concurrent_downloads_are_faster(self):
+        with AssetServer(self.originals, delay=0.2) as server:
+            _, sequential = self.download(server, 1, list(self.originals))
+            _, concurrent = self.download(server, 4, list(self.originals))
+        self.assertLess(concurrent, sequential / 2)
+        
+    def test_results_keep_input_order(self):
+        ids = list(reversed(list(self.originals)))
+        with AssetServer(self.originals, delay=0.05) as server:
+            results, _ = self.download(server, 4, ids)
+        self.assertEqual([id for id, _ in results], ids)
+        for id, path in results:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.originals[id])
+                
+    def test_failed_asset_does_not_stop_the_rest(self):
+        ids = ["a0", "missing", "a1"]
+        with AssetServer(self.originals) as server:
+            results, _ = self.download(server, 2, ids)
+        self.assertEqual([id for id, _ in results], ids)
+        self.assertIsNone(results[1][1])
+        self.assertIsNotNone(results[0][1])
+        self.assertIsNotNone(results[2][1])
+        leftovers = [name for name in os.listdir(self.directory.name) if "missing" in name or name.endswith(PARTIAL_SUFFIX)]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
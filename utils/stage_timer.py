@@ -0,0 +1,50 @@
+import time
+import resource
+from contextlib import contextmanager, nullcontext
+
+
+def reset_peak_rss():
+    """Resets the kernel's peak RSS counter for this process (Linux only). Returns False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # Falls back to the lifetime peak, which cannot be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageTimer:
+    """Accumulates wall time and the peak RSS reached inside each named stage."""
+    
+    def __init__(self):
+        self.results: dict[str, dict] = {}
+        
+    @contextmanager
+    def stage(self, name):
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            result = self.results.setdefault(name, {"seconds": 0.0, "peak_rss_kb": 0, "calls": 0})
+            result["seconds"] += elapsed
+            result["peak_rss_kb"] = max(result["peak_rss_kb"], peak_rss_kb())
+            result["calls"] += 1
+
+
+def timed(timer, name):
+    """Times a stage on timer, or does nothing when timer is None."""
+    return timer.stage(name) if timer is not None else nullcontext()